@@ -15,13 +15,25 @@ import argparse
 import sys
 import pandas as pd
 import numpy as np
+from run_catalog import CATALOG_PATH, connect, selected_runs, filter_entries
+from sampling import with_item_count, weighted_latency_summary
+import profiling
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("-test", "--test", help="Test name")
+parser.add_argument("-runs", "--runs", nargs="+",
+                    help="Only analyze the telemetry of these cataloged runs")
+parser.add_argument("-catalog", "--catalog", default=CATALOG_PATH,
+                    help="Path to the run catalog")
+parser.add_argument("-raw_data", "--raw_data", default="./../raw_data/",
+                    help="Directory with the <runtime>.csv raw data, e.g. the output of simulate_triggers.py")
+profiling.add_profile_arguments(parser)
 
 args = parser.parse_args()
 
+profiling.configure(args, "analyze_latency")
+
 load_dotenv('./../../.env')
 
 triggers = ["http", "storage", "queue",
@@ -34,17 +46,33 @@ is_test = False
 if(str(args.test).lower() != "none"):
     is_test = True
 
+runs = None
+if(args.runs is not None):
+    runs = selected_runs(parser, connect(args.catalog), run_ids=args.runs)
+
 latency_results = pd.DataFrame(
     columns=["runtime", "trigger_type",
-             "invoke_type", "invoke_input", "latency"])
+             "invoke_type", "invoke_input", "latency", "weight"])
 
 for runtime in runtimes:
 
+    profiling.start_stage(runtime)
+    profiling.start_stage("load")
+
     if(is_test):
         all_entries = pd.read_csv("./../tests/" + str(args.test) + ".csv")
     else:
         all_entries = pd.read_csv(
-            "./../raw_data/" + runtime + ".csv")
+            os.path.join(args.raw_data, runtime + ".csv"))
+
+    all_entries = with_item_count(all_entries)
+
+    if(runs is not None):
+        all_entries = filter_entries(all_entries, runs)
+
+    profiling.end_stage(rows_out=len(all_entries.index))
+    profiling.start_stage("match", rows_in=len(all_entries.index))
+    rows_before = len(latency_results.index)
 
     for trigger_type in triggers:
         if(not is_test):
@@ -73,13 +101,39 @@ for runtime in runtimes:
                 delta = datetime.strptime(
                     receiver.values[0][2], '%Y-%m-%d %H:%M:%S.%f') - datetime.strptime(invoker.values[0][2], '%Y-%m-%d %H:%M:%S.%f')
 
+                # Adaptive sampling keeps or drops all telemetry of an
+                # operation id together, so a latency pair was kept once with
+                # the operation's itemCount, not once per side
+                weight = max(invoker['item_count'].values[0],
+                             receiver['item_count'].values[0])
+
                 if(delta.seconds < 500):
                     latency_results = latency_results.append({"runtime": runtime, "trigger_type": trigger_type,
-                                                              "invoke_type": invoker.values[0][8], "invoke_input": int(float(invoker.values[0][9])), "latency": (delta.seconds*1000000 + delta.microseconds) / 1000}, ignore_index=True)
+                                                              "invoke_type": invoker.values[0][8], "invoke_input": int(float(invoker.values[0][9])), "latency": (delta.seconds*1000000 + delta.microseconds) / 1000, "weight": weight}, ignore_index=True)
+
+    profiling.end_stage(rows_out=len(latency_results.index) - rows_before)
+    profiling.end_stage()
+
+profiling.start_stage("summary", rows_in=len(latency_results.index))
+
+latency_summary = pd.DataFrame(columns=["runtime", "trigger_type", "invoke_type", "invoke_input", "samples", "estimated_count",
+                                        "effective_samples", "mean_latency", "mean_latency_low", "mean_latency_high", "sampled"])
+
+for (runtime, trigger_type, invoke_type, invoke_input), group in latency_results.groupby(["runtime", "trigger_type", "invoke_type", "invoke_input"]):
+    latency_summary = latency_summary.append(dict({"runtime": runtime, "trigger_type": trigger_type, "invoke_type": invoke_type, "invoke_input": invoke_input},
+                                                  **weighted_latency_summary(group['latency'], group['weight'])), ignore_index=True)
+
+profiling.end_stage(rows_out=len(latency_summary.index))
+profiling.start_stage("write", rows_in=len(latency_results.index) + len(latency_summary.index))
 
 if(is_test):
     path = "./../tests/results.csv"
+    summary_path = "./../tests/summary.csv"
 else:
     path = "./../results/latency/results.csv"
+    summary_path = "./../results/latency/summary.csv"
 
 latency_results.to_csv(path, index=False)
+latency_summary.to_csv(summary_path, index=False)
+
+profiling.end_stage()
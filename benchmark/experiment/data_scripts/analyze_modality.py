@@ -0,0 +1,50 @@
+import argparse
+import os
+import pandas as pd
+from modality import BANDWIDTH_ADJUST, MIN_SIGNIFICANCE, MIN_WEIGHT, mode_table, modality_table, trend_table
+import profiling
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-input", "--input", default="./../results/latency/results.csv",
+                    help="Latency results written by analyze_latency.py")
+parser.add_argument("-output", "--output", default="./../results/latency/",
+                    help="Directory to write modes.csv, modality.csv and modality_trend.csv to")
+parser.add_argument("-adjust", "--adjust", type=float, default=BANDWIDTH_ADJUST,
+                    help="Multiplier of the nrd0 KDE bandwidth, smaller values separate closer modes")
+parser.add_argument("-significance", "--significance", type=float, default=MIN_SIGNIFICANCE,
+                    help="Minimum rise of a mode above its valleys, in standard deviations of the sampling noise")
+parser.add_argument("-min_weight", "--min_weight", type=float, default=MIN_WEIGHT,
+                    help="Minimum share of the samples of a setting in a mode")
+profiling.add_profile_arguments(parser)
+
+args = parser.parse_args()
+
+profiling.configure(args, "analyze_modality")
+
+profiling.start_stage("load")
+latency_results = pd.read_csv(args.input)
+profiling.end_stage(rows_out=len(latency_results.index))
+
+profiling.start_stage("modes", rows_in=len(latency_results.index))
+modes = mode_table(latency_results, adjust=args.adjust,
+                   significance=args.significance, min_weight=args.min_weight)
+profiling.end_stage(rows_out=len(modes.index))
+
+profiling.start_stage("summary", rows_in=len(modes.index))
+modality = modality_table(modes)
+trend = trend_table(modality)
+profiling.end_stage(rows_out=len(modality.index) + len(trend.index))
+
+profiling.start_stage("write")
+os.makedirs(args.output, exist_ok=True)
+modes.to_csv(os.path.join(args.output, "modes.csv"), index=False)
+modality.to_csv(os.path.join(args.output, "modality.csv"), index=False)
+trend.to_csv(os.path.join(args.output, "modality_trend.csv"), index=False)
+profiling.end_stage()
+
+for _, row in trend[trend["multimodal_inputs"] > 0].iterrows():
+    print(row["trigger_type"] + ' in ' + row["runtime"] + ' (' + row["invoke_type"] + '): ' +
+          str(row["multimodal_inputs"]) + '/' + str(row["inputs"]) + ' settings multi-modal, modes ' +
+          "{:.0f}".format(row["mode_spacing"]) + 'ms apart' +
+          (', tune ' + row["tuning"] if row["tuning"] != "" else ''))
@@ -15,13 +15,28 @@ import argparse
 import sys
 import pandas as pd
 import numpy as np
+from reordering import legacy_out_of_order, reordering_stats, merge_reordering_stats, reordering_columns, reorder_density_rows
+from run_catalog import CATALOG_PATH, connect, selected_runs, filter_entries
+from sampling import with_item_count, sampling_stats, merge_sampling_stats, sampling_columns
+import profiling
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("-test", "--test", help="Test name")
+parser.add_argument("-runs", "--runs", nargs="+",
+                    help="Only analyze the telemetry of these cataloged runs")
+parser.add_argument("-catalog", "--catalog", default=CATALOG_PATH,
+                    help="Path to the run catalog")
+parser.add_argument("-raw_data", "--raw_data", default="./../raw_data/",
+                    help="Directory with the <runtime>.csv raw data, e.g. the output of simulate_triggers.py")
+parser.add_argument("-skip_legacy_order", "--skip_legacy_order", action="store_true",
+                    help="Skip the greedy out_of_order walk, which is quadratic in the number of events")
+profiling.add_profile_arguments(parser)
 
 args = parser.parse_args()
 
+profiling.configure(args, "analyze_reliability")
+
 load_dotenv('./../../.env')
 
 runtime_pick = ["node", "dotnet"]
@@ -31,18 +46,38 @@ is_test = False
 if(str(args.test).lower() != "none"):
     is_test = True
 
+runs = None
+if(args.runs is not None):
+    runs = selected_runs(parser, connect(args.catalog), run_ids=args.runs)
+
 reliability_results = pd.DataFrame(columns=["runtime", "trigger_type", "original_invokes", "original_executes", "duplicates_invokes",
                                             "duplicates_executes", "missing_executes", "out_of_order", "invoke_type", "invoke_input"])
 
+reordering_results = {}
+sampling_results = {}
+
 for runtime in runtime_pick:
 
+    profiling.start_stage(runtime)
+    profiling.start_stage("load")
+
     if(is_test):
         all_entries = pd.read_csv("./../tests/" + str(args.test) + ".csv")
     else:
         all_entries = pd.read_csv(
-            "./../raw_data/" + runtime + ".csv")
+            os.path.join(args.raw_data, runtime + ".csv"))
+
+    all_entries = with_item_count(all_entries)
 
-    all_entries = all_entries.sort_values(by='timestamp')
+    if(runs is not None):
+        all_entries = filter_entries(all_entries, runs)
+
+    # Stable so that events with equal timestamps keep their file order
+    all_entries = all_entries.sort_values(by='timestamp', kind='stable')
+
+    profiling.end_stage(rows_out=len(all_entries.index))
+    profiling.start_stage("analyze", rows_in=len(all_entries.index))
+    rows_before = len(reliability_results.index)
 
     all_entries = all_entries.groupby('trigger')
 
@@ -73,10 +108,8 @@ for runtime in runtime_pick:
                 invoke_amount = len(invoke_order.index)
                 receiver_amount = len(receiver_order.index)
 
-                missing_executes = []
-                for operation_id in invoke_order.operation_id:
-                    if(operation_id not in receiver_order['operation_id'].values):
-                        missing_executes.append(operation_id)
+                missing_executes = invoke_order.operation_id[~invoke_order.operation_id.isin(
+                    receiver_order['operation_id'])].tolist()
 
                 invoke_duplicates_amount = len(invoke_order[
                     'iteration_id'].to_list()) - len(list(set(invoke_order[
@@ -101,21 +134,34 @@ for runtime in runtime_pick:
                 invoke_order_ids = invoke_order_no_duplicates.operation_id.tolist()
                 receiver_order_ids = receiver_order_no_duplicates.operation_id.tolist()
 
-                for operation_id in missing_executes:
-                    if(operation_id in invoke_order_ids):
-                        invoke_order_ids.remove(operation_id)
-
-                count = -1
-                out_of_order = 0
-
-                for invoke_id in invoke_order_ids:
-                    count = count + 1
-                    if count < len(receiver_order_ids):
-                        if invoke_id != receiver_order_ids[count]:
-                            out_of_order = out_of_order + 1
-                            if invoke_id in receiver_order_ids:
-                                receiver_order_ids.remove(invoke_id)
-                                receiver_order_ids.insert(count, invoke_id)
+                missing_ids = set(missing_executes)
+                invoke_order_ids = [
+                    operation_id for operation_id in invoke_order_ids if operation_id not in missing_ids]
+
+                reordering_key = (runtime, trigger_type,
+                                  trigger_mode, int(float(trigger_input)))
+                reordering = reordering_stats(
+                    invoke_order_ids, receiver_order_ids)
+                if(reordering_key in reordering_results):
+                    reordering = merge_reordering_stats(
+                        reordering_results[reordering_key], reordering)
+                reordering_results[reordering_key] = reordering
+
+                # Sampling weights of each distinct invoked and delivered event
+                sampling = sampling_stats(invoke_order.drop_duplicates(subset=['operation_id'])['item_count'],
+                                          receiver_order.drop_duplicates(subset=['operation_id'])[
+                                              'item_count'],
+                                          len(missing_executes))
+                if(reordering_key in sampling_results):
+                    sampling = merge_sampling_stats(
+                        sampling_results[reordering_key], sampling)
+                sampling_results[reordering_key] = sampling
+
+                if(args.skip_legacy_order):
+                    out_of_order = np.nan
+                else:
+                    out_of_order = legacy_out_of_order(
+                        invoke_order_ids, receiver_order_ids)
 
                 row = reliability_results.loc[(reliability_results['runtime'] == runtime) & (reliability_results['trigger_type'] == trigger_type) &
                                               (reliability_results['invoke_type'] == trigger_mode) & (reliability_results['invoke_input'] == int(float(trigger_input)))]
@@ -128,11 +174,45 @@ for runtime in runtime_pick:
                     reliability_results.loc[(reliability_results['runtime'] == runtime) & (reliability_results['trigger_type'] == trigger_type) & (reliability_results['invoke_type'] == trigger_mode) & (reliability_results['invoke_input'] == int(float(trigger_input))), ["original_invokes", "original_executes", "duplicates_invokes", "duplicates_executes", "missing_executes", "out_of_order"]] = [(
                         row[2] + invoke_amount), (row[3] + receiver_amount), (row[4] + invoke_duplicates_amount), (row[5] + receiver_duplicates_amount), (row[6] + len(missing_executes)), (row[7] + out_of_order)]
 
+    profiling.end_stage(rows_out=len(reliability_results.index) - rows_before)
+    profiling.end_stage()
+
+profiling.start_stage("merge_metrics", rows_in=len(reliability_results.index))
+
 reliability_results.drop(["duplicates_invokes"], axis=1, inplace=True)
 
+reordering_columns_results = pd.DataFrame([dict(zip(["runtime", "trigger_type", "invoke_type", "invoke_input"], key), **reordering_columns(stats))
+                                           for key, stats in reordering_results.items()],
+                                          columns=["runtime", "trigger_type", "invoke_type", "invoke_input", "inversions", "kendall_tau_distance", "max_displacement", "mean_displacement"])
+
+sampling_columns_results = pd.DataFrame([dict(zip(["runtime", "trigger_type", "invoke_type", "invoke_input"], key), **sampling_columns(stats))
+                                         for key, stats in sampling_results.items()],
+                                        columns=["runtime", "trigger_type", "invoke_type", "invoke_input", "estimated_invokes", "estimated_executes",
+                                                 "estimated_missing_executes", "missing_executes_low", "missing_executes_high", "sampling_explained"])
+
+reliability_results = reliability_results.astype({"invoke_input": int}).merge(
+    reordering_columns_results, on=["runtime", "trigger_type", "invoke_type", "invoke_input"], how="left").merge(
+    sampling_columns_results, on=["runtime", "trigger_type", "invoke_type", "invoke_input"], how="left")
+
+if(not is_test):
+    for _, flagged in reliability_results[reliability_results['sampling_explained']].iterrows():
+        print('Missing executes for ' + flagged['trigger_type'] + ' in ' + flagged['runtime'] + ' (' + flagged['invoke_type'] + ', ' +
+              str(flagged['invoke_input']) + ') are explained by Application Insights sampling')
+
+reorder_density_results = pd.DataFrame([row for key, stats in reordering_results.items() for row in reorder_density_rows(key, stats)],
+                                       columns=["runtime", "trigger_type", "invoke_type", "invoke_input", "displacement", "count", "density"])
+
+profiling.end_stage(rows_out=len(reliability_results.index))
+profiling.start_stage("write", rows_in=len(reliability_results.index) + len(reorder_density_results.index))
+
 if(is_test):
     path = "./../tests/results.csv"
+    density_path = "./../tests/reorder_density.csv"
 else:
     path = "./../results/reliability/results.csv"
+    density_path = "./../results/reliability/reorder_density.csv"
 
 reliability_results.to_csv(path, index=False)
+reorder_density_results.to_csv(density_path, index=False)
+
+profiling.end_stage()
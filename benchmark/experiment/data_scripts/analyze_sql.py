@@ -0,0 +1,441 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+from reordering import legacy_out_of_order, reordering_stats, reordering_columns
+from sampling import item_counts, sampling_columns
+from run_catalog import CATALOG_PATH, connect, select_runs, selected_runs, filter_entries
+import profiling
+
+DATABASE_PATH = './../results/analysis.db'
+
+TRIGGERS = ["http", "storage", "queue",
+            "database", "eventhub", "eventgrid", "servicebustopic"]
+
+RUNTIMES = ["node", "dotnet"]
+
+GROUP_COLUMNS = ["runtime", "trigger_type", "invoke_type", "invoke_input"]
+
+RELIABILITY_COLUMNS = ["runtime", "trigger_type", "original_invokes", "original_executes", "duplicates_executes", "missing_executes",
+                       "out_of_order", "invoke_type", "invoke_input", "inversions", "kendall_tau_distance", "max_displacement",
+                       "mean_displacement", "estimated_invokes", "estimated_executes", "estimated_missing_executes",
+                       "missing_executes_low", "missing_executes_high", "sampling_explained"]
+
+# source_runtime is the raw data file a row was loaded from, which is the
+# runtime the pandas analyzers attribute the row to
+SCHEMA = '''
+CREATE TABLE load_info (source TEXT NOT NULL);
+
+CREATE TABLE entries (
+    row_id INTEGER PRIMARY KEY,
+    source_runtime TEXT NOT NULL,
+    type TEXT,
+    name TEXT,
+    timestamp TEXT,
+    timestamp_us INTEGER,
+    operation_id,
+    runtime TEXT,
+    trigger TEXT,
+    duration TEXT,
+    iteration_id,
+    invoke_mode TEXT,
+    invoke_input INTEGER,
+    item_count INTEGER NOT NULL);
+
+CREATE INDEX entries_operation_id ON entries (operation_id);
+CREATE INDEX entries_setting ON entries (source_runtime, trigger, invoke_mode, invoke_input);
+CREATE INDEX entries_runtime ON entries (runtime, trigger);
+CREATE INDEX entries_timestamp ON entries (timestamp_us);
+CREATE INDEX entries_name ON entries (source_runtime, trigger, name, operation_id);
+
+-- Invoker telemetry of every trigger, the http trigger is invoked through its own endpoint
+CREATE VIEW invocations AS
+SELECT * FROM entries
+WHERE name = CASE WHEN trigger = 'http' THEN 'get /api/httptrigger-' || source_runtime
+                  ELSE 'completiontrack' || trigger END;
+
+CREATE VIEW receptions AS
+SELECT * FROM entries
+WHERE name = 'custom operationid ' || trigger;
+
+-- Operations with exactly two rows of some telemetry type, as required by analyze_latency.py
+CREATE VIEW latency_operations AS
+SELECT DISTINCT source_runtime, trigger, operation_id
+FROM entries
+GROUP BY source_runtime, trigger, operation_id, type
+HAVING COUNT(*) = 2;
+
+CREATE VIEW latency AS
+WITH first_invocations AS (
+    SELECT source_runtime, trigger, operation_id, MIN(row_id) AS row_id
+    FROM invocations GROUP BY source_runtime, trigger, operation_id),
+first_receptions AS (
+    SELECT source_runtime, trigger, operation_id, MIN(row_id) AS row_id
+    FROM receptions GROUP BY source_runtime, trigger, operation_id)
+SELECT invoker.source_runtime AS runtime,
+       invoker.trigger AS trigger_type,
+       invoker.invoke_mode AS invoke_type,
+       invoker.invoke_input AS invoke_input,
+       (receiver.timestamp_us - invoker.timestamp_us) / 1000.0 AS latency,
+       MAX(invoker.item_count, receiver.item_count) AS weight,
+       invoker.operation_id AS operation_id
+FROM latency_operations AS operations
+JOIN first_invocations USING (source_runtime, trigger, operation_id)
+JOIN first_receptions USING (source_runtime, trigger, operation_id)
+JOIN entries AS invoker ON invoker.row_id = first_invocations.row_id
+JOIN entries AS receiver ON receiver.row_id = first_receptions.row_id
+WHERE receiver.timestamp_us - invoker.timestamp_us BETWEEN 0 AND 499999999;
+
+CREATE VIEW reliability_counts AS
+WITH invoke_counts AS (
+    SELECT source_runtime, trigger, invoke_mode, invoke_input, COUNT(*) AS original_invokes
+    FROM invocations GROUP BY source_runtime, trigger, invoke_mode, invoke_input),
+receive_counts AS (
+    SELECT source_runtime, trigger, invoke_mode, invoke_input, COUNT(*) AS original_executes,
+           COUNT(*) - COUNT(DISTINCT operation_id) AS duplicates_executes
+    FROM receptions GROUP BY source_runtime, trigger, invoke_mode, invoke_input),
+missing_counts AS (
+    SELECT source_runtime, trigger, invoke_mode, invoke_input, COUNT(*) AS missing_executes
+    FROM invocations AS invoker
+    WHERE NOT EXISTS (SELECT 1 FROM receptions AS receiver
+                      WHERE receiver.source_runtime = invoker.source_runtime AND receiver.trigger = invoker.trigger
+                        AND receiver.invoke_mode = invoker.invoke_mode AND receiver.invoke_input = invoker.invoke_input
+                        AND receiver.operation_id = invoker.operation_id)
+    GROUP BY source_runtime, trigger, invoke_mode, invoke_input),
+settings AS (
+    SELECT source_runtime, trigger, invoke_mode, invoke_input FROM invoke_counts
+    UNION
+    SELECT source_runtime, trigger, invoke_mode, invoke_input FROM receive_counts)
+SELECT settings.source_runtime AS runtime,
+       settings.trigger AS trigger_type,
+       COALESCE(original_invokes, 0) AS original_invokes,
+       COALESCE(original_executes, 0) AS original_executes,
+       COALESCE(duplicates_executes, 0) AS duplicates_executes,
+       COALESCE(missing_executes, 0) AS missing_executes,
+       settings.invoke_mode AS invoke_type,
+       settings.invoke_input AS invoke_input
+FROM settings
+LEFT JOIN invoke_counts USING (source_runtime, trigger, invoke_mode, invoke_input)
+LEFT JOIN receive_counts USING (source_runtime, trigger, invoke_mode, invoke_input)
+LEFT JOIN missing_counts USING (source_runtime, trigger, invoke_mode, invoke_input);
+
+-- Sampling weights of the first row of every distinct invoked and delivered operation
+CREATE VIEW sampling_weights AS
+WITH distinct_invocations AS (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, operation_id
+                                 ORDER BY timestamp_us, row_id) AS occurrence
+    FROM invocations),
+distinct_receptions AS (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, operation_id
+                                 ORDER BY timestamp_us, row_id) AS occurrence
+    FROM receptions)
+SELECT source_runtime AS runtime, trigger AS trigger_type, invoke_mode AS invoke_type, invoke_input,
+       SUM(invokes) AS invokes, SUM(invokes_var) AS invokes_var,
+       SUM(executes) AS executes, SUM(executes_var) AS executes_var, MAX(sampled) AS sampled
+FROM (SELECT source_runtime, trigger, invoke_mode, invoke_input,
+             item_count AS invokes, item_count * (item_count - 1) AS invokes_var,
+             0 AS executes, 0 AS executes_var, item_count > 1 AS sampled
+      FROM distinct_invocations WHERE occurrence = 1
+      UNION ALL
+      SELECT source_runtime, trigger, invoke_mode, invoke_input,
+             0, 0, item_count, item_count * (item_count - 1), item_count > 1
+      FROM distinct_receptions WHERE occurrence = 1)
+GROUP BY source_runtime, trigger, invoke_mode, invoke_input;
+
+-- Invoke and receive sequences without duplicated telemetry, as compared by analyze_reliability.py
+CREATE VIEW invoke_sequence AS
+WITH unique_iterations AS (
+    SELECT *, COUNT(*) OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, iteration_id) AS iteration_rows
+    FROM invocations),
+unique_operations AS (
+    SELECT *, COUNT(*) OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, operation_id) AS operation_rows
+    FROM unique_iterations WHERE iteration_rows = 1)
+SELECT * FROM unique_operations AS invoker
+WHERE operation_rows = 1
+  AND EXISTS (SELECT 1 FROM receptions AS receiver
+              WHERE receiver.source_runtime = invoker.source_runtime AND receiver.trigger = invoker.trigger
+                AND receiver.invoke_mode = invoker.invoke_mode AND receiver.invoke_input = invoker.invoke_input
+                AND receiver.operation_id = invoker.operation_id);
+
+CREATE VIEW receive_sequence AS
+WITH unique_operations AS (
+    SELECT *, COUNT(*) OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, operation_id) AS operation_rows
+    FROM receptions),
+unique_iterations AS (
+    SELECT *, COUNT(*) OVER (PARTITION BY source_runtime, trigger, invoke_mode, invoke_input, iteration_id) AS iteration_rows
+    FROM unique_operations WHERE operation_rows = 1)
+SELECT * FROM unique_iterations WHERE iteration_rows = 1;
+'''
+
+
+def read_entries(args):
+    for runtime in RUNTIMES:
+        if(args.test is not None):
+            entries = pd.read_csv("./../tests/" + str(args.test) + ".csv")
+        else:
+            path = os.path.join(args.raw_data, runtime + ".csv")
+            if(not os.path.exists(path)):
+                continue
+            entries = pd.read_csv(path)
+        yield runtime, entries
+
+
+def load(connection, args, runs=None):
+    connection.executescript(SCHEMA)
+    rows = 0
+    for runtime, entries in read_entries(args):
+        if(runs is not None):
+            entries = filter_entries(entries, runs)
+        entries = entries.copy()
+        entries.insert(0, "source_runtime", runtime)
+        entries["timestamp_us"] = pd.to_datetime(
+            entries["timestamp"]).values.astype('datetime64[us]').astype(np.int64)
+        entries["invoke_input"] = pd.to_numeric(
+            entries["invoke_input"], errors='coerce').astype('Int64')
+        entries["item_count"] = item_counts(entries)
+        entries.to_sql("entries", connection, if_exists="append", index=False)
+        rows = rows + len(entries.index)
+    connection.execute("ANALYZE")
+    connection.commit()
+    return rows
+
+
+def load_source(args):
+    # Identifies the loaded raw data, so a database is reloaded when the raw data or the selected runs change
+    if(args.test is not None):
+        files = [os.path.join("./../tests/", str(args.test) + ".csv")]
+    else:
+        files = [os.path.join(args.raw_data, runtime + ".csv")
+                 for runtime in RUNTIMES]
+    return json.dumps({"files": [[os.path.abspath(path), os.path.getmtime(path)] for path in files if os.path.exists(path)],
+                       "runs": args.runs})
+
+
+def loaded_source(connection):
+    try:
+        row = connection.execute('SELECT source FROM load_info').fetchone()
+    except sqlite3.DatabaseError:
+        return None
+    return row[0] if row is not None else None
+
+
+def open_database(args):
+    source = load_source(args)
+    if(args.database != ":memory:" and os.path.exists(args.database) and args.command != "load"):
+        connection = sqlite3.connect(args.database)
+        if(loaded_source(connection) == source):
+            return connection
+        connection.close()
+
+    if(args.database != ":memory:"):
+        os.makedirs(os.path.dirname(args.database) or ".", exist_ok=True)
+        if(os.path.exists(args.database)):
+            os.remove(args.database)
+    connection = sqlite3.connect(args.database)
+
+    runs = None
+    if(args.runs is not None):
+        runs = select_runs(connect(args.catalog), run_ids=args.runs)
+    profiling.start_stage("load")
+    rows = load(connection, args, runs)
+    connection.execute('INSERT INTO load_info VALUES (?)', (source,))
+    connection.commit()
+    profiling.end_stage(rows_out=rows)
+    return connection
+
+
+def latency_results(connection):
+    return pd.read_sql_query('''SELECT runtime, trigger_type, invoke_type, invoke_input, latency, weight FROM latency
+                                ORDER BY CASE runtime ''' + " ".join("WHEN '" + runtime + "' THEN " + str(i) for i, runtime in enumerate(RUNTIMES)) + ''' END,
+                                         CASE trigger_type ''' + " ".join("WHEN '" + trigger + "' THEN " + str(i) for i, trigger in enumerate(TRIGGERS)) + ''' END,
+                                         operation_id''', connection)
+
+
+def sequences(connection, view):
+    # Operation ids of every setting in timestamp order
+    rows = connection.execute('SELECT source_runtime, trigger, invoke_mode, invoke_input, operation_id FROM ' + view +
+                              ' ORDER BY source_runtime, trigger, invoke_mode, invoke_input, timestamp_us, row_id')
+    result = {}
+    for runtime, trigger, invoke_mode, invoke_input, operation_id in rows:
+        result.setdefault((runtime, trigger, invoke_mode,
+                          invoke_input), []).append(operation_id)
+    return result
+
+
+def reliability_results(connection, skip_legacy_order=False):
+    counts = pd.read_sql_query(
+        'SELECT * FROM reliability_counts', connection)
+
+    invoke_sequences = sequences(connection, 'invoke_sequence')
+    receive_sequences = sequences(connection, 'receive_sequence')
+
+    ordering = []
+    for key in counts[GROUP_COLUMNS].itertuples(index=False, name=None):
+        invoke_ids = invoke_sequences.get(key, [])
+        receive_ids = receive_sequences.get(key, [])
+        row = dict(zip(GROUP_COLUMNS, key), **
+                   reordering_columns(reordering_stats(invoke_ids, receive_ids)))
+        row["out_of_order"] = np.nan if skip_legacy_order else legacy_out_of_order(
+            invoke_ids, receive_ids)
+        ordering.append(row)
+    ordering = pd.DataFrame(ordering, columns=GROUP_COLUMNS + ["out_of_order", "inversions", "kendall_tau_distance",
+                                                              "max_displacement", "mean_displacement"])
+
+    weights = pd.read_sql_query('SELECT * FROM sampling_weights', connection)
+    weights = weights.merge(
+        counts[GROUP_COLUMNS + ["missing_executes"]], on=GROUP_COLUMNS)
+    weights = pd.DataFrame([dict(zip(GROUP_COLUMNS, [row.runtime, row.trigger_type, row.invoke_type, row.invoke_input]),
+                                 **sampling_columns({"invokes": float(row.invokes), "invokes_var": float(row.invokes_var),
+                                                     "executes": float(row.executes), "executes_var": float(row.executes_var),
+                                                     "observed_missing": row.missing_executes, "sampled": bool(row.sampled)}))
+                            for row in weights.itertuples()],
+                           columns=GROUP_COLUMNS + ["estimated_invokes", "estimated_executes", "estimated_missing_executes",
+                                                    "missing_executes_low", "missing_executes_high", "sampling_explained"])
+
+    results = counts.merge(ordering, on=GROUP_COLUMNS, how="left").merge(
+        weights, on=GROUP_COLUMNS, how="left")
+    return results[RELIABILITY_COLUMNS]
+
+
+def compare_results(sql_results, pandas_results, columns):
+    # Results match when they hold the same rows, regardless of row order
+    sql_results = sql_results[columns].sort_values(
+        by=columns, ignore_index=True)
+    pandas_results = pandas_results[columns].sort_values(
+        by=columns, ignore_index=True)
+    if(len(sql_results.index) != len(pandas_results.index)):
+        return False
+    for column in columns:
+        if(pd.api.types.is_numeric_dtype(pandas_results[column])):
+            if(not np.allclose(sql_results[column].astype(float), pandas_results[column].astype(float), equal_nan=True)):
+                return False
+        elif(not (sql_results[column].astype(str) == pandas_results[column].astype(str)).all()):
+            return False
+    return True
+
+
+def run_pandas(script, args):
+    command = [sys.executable, script]
+    if(args.test is not None):
+        command = command + ["-test", str(args.test)]
+    else:
+        command = command + ["-raw_data", args.raw_data]
+    if(args.runs is not None):
+        command = command + ["-runs"] + args.runs + ["-catalog", args.catalog]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def benchmark(args):
+    # Times the pandas analyzers against the SQL backend on the same raw data and compares their results
+    if(args.test is not None):
+        latency_path = "./../tests/results.csv"
+        reliability_path = "./../tests/results.csv"
+    else:
+        latency_path = "./../results/latency/results.csv"
+        reliability_path = "./../results/reliability/results.csv"
+
+    args.database = ":memory:"
+    start = time.perf_counter()
+    connection = open_database(args)
+    load_time = time.perf_counter() - start
+
+    pandas_time = run_pandas("analyze_latency.py", args)
+    pandas_latency = pd.read_csv(latency_path)
+    start = time.perf_counter()
+    sql_latency = latency_results(connection)
+    sql_time = time.perf_counter() - start
+    print("latency: pandas " + "{:.3f}".format(pandas_time) + "s, sql " + "{:.3f}".format(sql_time) + "s (+" +
+          "{:.3f}".format(load_time) + "s load), results " +
+          ("match" if compare_results(sql_latency, pandas_latency, ["runtime", "trigger_type", "invoke_type", "invoke_input", "latency", "weight"]) else "DIFFER"))
+
+    pandas_time = run_pandas("analyze_reliability.py", args)
+    pandas_reliability = pd.read_csv(reliability_path)
+    start = time.perf_counter()
+    sql_reliability = reliability_results(connection)
+    sql_time = time.perf_counter() - start
+    print("reliability: pandas " + "{:.3f}".format(pandas_time) + "s, sql " + "{:.3f}".format(sql_time) + "s (+" +
+          "{:.3f}".format(load_time) + "s load), results " +
+          ("match" if compare_results(sql_reliability, pandas_reliability, RELIABILITY_COLUMNS) else "DIFFER"))
+
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-test", "--test", help="Test name")
+parser.add_argument("-raw_data", "--raw_data", default="./../raw_data/",
+                    help="Directory with the <runtime>.csv raw data")
+parser.add_argument("-runs", "--runs", nargs="+",
+                    help="Only load the telemetry of these cataloged runs")
+parser.add_argument("-catalog", "--catalog", default=CATALOG_PATH,
+                    help="Path to the run catalog")
+parser.add_argument("-database", "--database", default=DATABASE_PATH,
+                    help="SQLite database the raw data is loaded into, reused by later commands until the raw data changes")
+parser.add_argument("-skip_legacy_order", "--skip_legacy_order", action="store_true",
+                    help="Skip the greedy out_of_order walk, which is quadratic in the number of events")
+profiling.add_profile_arguments(parser)
+
+subparsers = parser.add_subparsers(dest="command", required=True)
+subparsers.add_parser("load", help="(Re)load the raw data into the database")
+subparsers.add_parser(
+    "latency", help="Write the latency results, as analyze_latency.py")
+subparsers.add_parser(
+    "reliability", help="Write the reliability results, as analyze_reliability.py")
+query_parser = subparsers.add_parser(
+    "query", help="Run an ad-hoc SQL query against the entries table and the analysis views")
+query_parser.add_argument("sql")
+query_parser.add_argument("-output", "--output",
+                          help="Write the query result to this CSV file instead of printing it")
+subparsers.add_parser(
+    "benchmark", help="Time the pandas analyzers against this backend and compare their results, overwrites the pandas results")
+
+args = parser.parse_args()
+
+profiling.configure(args, "analyze_sql")
+
+# Unknown run ids fail before anything is loaded
+if(args.runs is not None):
+    selected_runs(parser, connect(args.catalog), run_ids=args.runs)
+
+# Fixtures are small and loaded fresh on every run
+if(args.test is not None):
+    args.database = ":memory:"
+
+if(args.command == "benchmark"):
+    benchmark(args)
+    sys.exit(0)
+
+connection = open_database(args)
+
+if(args.test is not None):
+    latency_path = "./../tests/sql_latency.csv"
+    reliability_path = "./../tests/sql_reliability.csv"
+else:
+    latency_path = "./../results/sql/latency.csv"
+    reliability_path = "./../results/sql/reliability.csv"
+
+if(args.command == "latency"):
+    profiling.start_stage("latency")
+    results = latency_results(connection)
+    profiling.end_stage(rows_out=len(results.index))
+    os.makedirs(os.path.dirname(latency_path), exist_ok=True)
+    results.to_csv(latency_path, index=False)
+elif(args.command == "reliability"):
+    profiling.start_stage("reliability")
+    results = reliability_results(connection, args.skip_legacy_order)
+    profiling.end_stage(rows_out=len(results.index))
+    os.makedirs(os.path.dirname(reliability_path), exist_ok=True)
+    results.to_csv(reliability_path, index=False)
+elif(args.command == "query"):
+    profiling.start_stage("query")
+    results = pd.read_sql_query(args.sql, connection)
+    profiling.end_stage(rows_out=len(results.index))
+    if(args.output is not None):
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
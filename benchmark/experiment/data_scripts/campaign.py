@@ -0,0 +1,264 @@
+import argparse
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import pandas as pd
+from run_catalog import CATALOG_PATH, TIME_FORMAT, connect, record_run
+from simulate_triggers import TRIGGERS, BURST_SIZES, INVOKE_DELAYS, TOTAL_TARGET_SAMPLES, SINGLE_BURST_SAMPLES_SHARE, CONSTANT_INVOCATIONS
+from campaign_backends import AzureBackend, LocalBackend
+
+TIMELINE_PATH = './../results/campaign/timeline.csv'
+
+# Probe settings in seconds, replacing the fixed sleeps of run_benchmark.sh
+PROBE_INTERVAL = 5
+MAX_PROBE_INTERVAL = 30
+READY_TIMEOUT = 15 * 60
+QUIET_PERIOD = 60
+COOL_DOWN_TIMEOUT = 10 * 60
+
+_catalog_lock = threading.Lock()
+
+
+def expected_invocations(invoke_mode, invoke_input):
+    # Invocations sent by one workload/k6.js run
+    if(invoke_mode == "constant"):
+        return CONSTANT_INVOCATIONS
+    if(invoke_input == 1):
+        return int(math.ceil(TOTAL_TARGET_SAMPLES * SINGLE_BURST_SAMPLES_SHARE))
+    return int(math.ceil(TOTAL_TARGET_SAMPLES / 4 / invoke_input)) * invoke_input
+
+
+def wait_until(probe, backend, timeout, interval=PROBE_INTERVAL, max_interval=MAX_PROBE_INTERVAL):
+    # Polls the probe with exponential backoff and returns the time waited
+    start = backend.now()
+    while not probe():
+        waited = backend.now() - start
+        if(waited >= timeout):
+            raise TimeoutError("Probe did not succeed within " + str(timeout) + "s")
+        backend.sleep(min(interval, timeout - waited))
+        interval = min(interval * 2, max_interval)
+    return backend.now() - start
+
+
+def quiescence_probe(backend, trigger, runtime, since, expected, quiet_period=QUIET_PERIOD):
+    # Telemetry is quiescent once every invocation was executed, or when the
+    # execution count did not change for quiet_period, e.g. after lost events.
+    # Telemetry reaches Application Insights minutes after the executions, so
+    # the quiet period only starts once the first executions showed up.
+    state = {"count": 0, "changed": None}
+
+    def probe():
+        count = backend.telemetry_count(trigger, runtime, since)
+        now = backend.now()
+        if(count != state["count"]):
+            state["count"] = count
+            state["changed"] = now
+        return count >= expected or (state["changed"] is not None and now - state["changed"] >= quiet_period)
+    return probe
+
+
+def step(stack, kind, action, depends_on, label=None):
+    return {"name": "/".join(stack) + "/" + (label if label is not None else kind), "stack": stack, "kind": kind,
+            "action": action, "depends_on": depends_on}
+
+
+def build_campaign(backend, triggers, runtimes, workloads, location=None, catalog=None, settings=None):
+    # One deploy -> warm_up -> (workload -> cool_down)* chain per trigger and runtime
+    settings = dict({"ready_timeout": READY_TIMEOUT, "quiet_period": QUIET_PERIOD,
+                     "cool_down_timeout": COOL_DOWN_TIMEOUT, "probe_interval": PROBE_INTERVAL}, **(settings or {}))
+    steps = []
+    # Runtimes outermost, a runtime switch redeploys the shared resources on Azure
+    for runtime in runtimes:
+        for trigger in triggers:
+            stack = (trigger, runtime)
+
+            def deploy(results, trigger=trigger, runtime=runtime):
+                backend.deploy(trigger, runtime)
+
+            def warm_up(results, trigger=trigger, runtime=runtime):
+                return wait_until(lambda: backend.is_ready(trigger, runtime), backend, settings["ready_timeout"],
+                                  settings["probe_interval"])
+
+            steps.append(step(stack, "deploy", deploy, []))
+            steps.append(step(stack, "warm_up", warm_up, [steps[-1]["name"]]))
+
+            for invoke_mode, invoke_input in workloads:
+                label = invoke_mode + "_" + str(invoke_input)
+
+                def workload(results, trigger=trigger, runtime=runtime, invoke_mode=invoke_mode, invoke_input=invoke_input):
+                    since = backend.now()
+                    start_time = datetime.utcnow().strftime(TIME_FORMAT)
+                    backend.run_workload(trigger, runtime, invoke_mode, invoke_input)
+                    end_time = datetime.utcnow().strftime(TIME_FORMAT)
+                    if(catalog is not None):
+                        with _catalog_lock:
+                            record_run(connect(catalog), trigger, runtime, location,
+                                       invoke_mode, invoke_input, start_time, end_time)
+                    return {"since": since, "expected": expected_invocations(invoke_mode, invoke_input)}
+
+                def cool_down(results, trigger=trigger, runtime=runtime, workload_name="/".join(stack) + "/" + label):
+                    run = results[workload_name]
+                    probe = quiescence_probe(backend, trigger, runtime, run["since"], run["expected"],
+                                             settings["quiet_period"])
+                    try:
+                        return wait_until(probe, backend, settings["cool_down_timeout"], settings["probe_interval"],
+                                          settings["probe_interval"])
+                    except TimeoutError:
+                        # Late executions only overlap the next run's delivery tail, keep going
+                        print('Telemetry of ' + workload_name + ' was not quiescent after ' +
+                              str(settings["cool_down_timeout"]) + 's')
+                        return settings["cool_down_timeout"]
+
+                steps.append(step(stack, "workload", workload,
+                             [steps[-1]["name"]], label))
+                steps.append(step(stack, "cool_down", cool_down,
+                             [steps[-1]["name"]], label + "/cool_down"))
+    return steps
+
+
+def run_campaign(steps, backend, budget):
+    # Runs the steps as soon as their dependencies are done. At most budget
+    # stacks are active at once, and stacks in the same backend environment
+    # never overlap. Returns the timeline of the steps.
+    status = {item["name"]: "pending" for item in steps}
+    remaining = {}
+    for item in steps:
+        remaining[item["stack"]] = remaining.get(item["stack"], 0) + 1
+    active = set()
+    environments = set()
+    results = {}
+    timeline = []
+    start = backend.now()
+
+    def finish(item, item_status):
+        status[item["name"]] = item_status
+        remaining[item["stack"]] = remaining[item["stack"]] - 1
+        if(remaining[item["stack"]] == 0 and item["stack"] in active):
+            active.remove(item["stack"])
+            environments.remove(backend.environment(*item["stack"]))
+
+    def run_step(item):
+        step_start = backend.now()
+        try:
+            results[item["name"]] = item["action"](results)
+            return step_start, backend.now(), None
+        except Exception as error:
+            return step_start, backend.now(), error
+
+    with ThreadPoolExecutor(max_workers=max(len(steps), 1)) as executor:
+        running = {}
+        while True:
+            for item in steps:
+                if(status[item["name"]] != "pending"):
+                    continue
+                dependencies = [status[name] for name in item["depends_on"]]
+                if(any(dependency in ["failed", "skipped"] for dependency in dependencies)):
+                    finish(item, "skipped")
+                elif(all(dependency == "done" for dependency in dependencies)):
+                    if(item["stack"] not in active):
+                        environment = backend.environment(*item["stack"])
+                        if(len(active) >= budget or environment in environments):
+                            continue
+                        active.add(item["stack"])
+                        environments.add(environment)
+                    status[item["name"]] = "running"
+                    running[executor.submit(run_step, item)] = item
+
+            if(len(running) == 0):
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = running.pop(future)
+                step_start, step_end, error = future.result()
+                if(error is not None):
+                    print('Step ' + item["name"] + ' failed: ' + str(error))
+                print(('Failed ' if error is not None else 'Finished ') + item["name"] + ' after ' +
+                      "{:.1f}".format(step_end - step_start) + 's')
+                timeline.append({"step": item["name"], "trigger": item["stack"][0], "runtime": item["stack"][1],
+                                 "kind": item["kind"], "start": step_start - start, "end": step_end - start,
+                                 "status": "failed" if error is not None else "done"})
+                finish(item, "failed" if error is not None else "done")
+
+    timeline = pd.DataFrame(timeline, columns=[
+                            "step", "trigger", "runtime", "kind", "start", "end", "status"])
+    skipped = [name for name, item_status in status.items()
+               if item_status == "skipped"]
+    return timeline, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-backend", "--backend", choices=["azure", "local"], default="azure",
+                        help="Deploy to Azure with deploy.sh, or to a local fake that delivers with the simulate_triggers.py models")
+    parser.add_argument("-trigger", "--trigger", nargs="+", default=TRIGGERS,
+                        help="Triggers to benchmark")
+    parser.add_argument("-runtime", "--runtime", nargs="+", default=["node"],
+                        help="Runtimes to benchmark")
+    parser.add_argument("-location", "--location", default="northeurope")
+    parser.add_argument("-burst", "--burst", nargs="*", type=int, default=BURST_SIZES,
+                        help="Burst sizes to run")
+    parser.add_argument("-delay", "--delay", nargs="*", type=int, default=INVOKE_DELAYS,
+                        help="Inter-arrival times in ms to run")
+    parser.add_argument("-budget", "--budget", type=int, default=4,
+                        help="Maximum number of trigger/runtime stacks deployed and benchmarked at once")
+    parser.add_argument("-ready_timeout", "--ready_timeout", type=float, default=READY_TIMEOUT,
+                        help="Seconds to wait for a deployed stack to become ready")
+    parser.add_argument("-quiet_period", "--quiet_period", type=float, default=QUIET_PERIOD,
+                        help="Seconds without new executions after which the telemetry of a run is quiescent")
+    parser.add_argument("-cool_down_timeout", "--cool_down_timeout", type=float, default=COOL_DOWN_TIMEOUT,
+                        help="Maximum seconds to wait for quiescent telemetry after a run")
+    parser.add_argument("-probe_interval", "--probe_interval", type=float, default=PROBE_INTERVAL,
+                        help="Seconds between readiness and quiescence probes")
+    parser.add_argument("-catalog", "--catalog",
+                        help="Run catalog to record the runs in, " + CATALOG_PATH + " with the Azure backend")
+    parser.add_argument("-timeline", "--timeline", default=TIMELINE_PATH,
+                        help="CSV file to write the step timeline to")
+    parser.add_argument("-plan", "--plan", action="store_true",
+                        help="Print the campaign steps and their dependencies without running them")
+    parser.add_argument("-time_scale", "--time_scale", type=float, default=0.001,
+                        help="Local backend: real seconds per simulated second")
+    parser.add_argument("-models", "--models",
+                        help="Local backend: JSON file with per-trigger overrides of the delivery model parameters")
+    parser.add_argument("-seed", "--seed", type=int)
+
+    args = parser.parse_args()
+
+    if(args.backend == "azure"):
+        backend = AzureBackend(args.location)
+        catalog = args.catalog if args.catalog is not None else CATALOG_PATH
+    else:
+        models = None
+        if(args.models is not None):
+            with open(args.models) as file:
+                models = json.load(file)
+        backend = LocalBackend(args.time_scale, args.seed, models)
+        catalog = args.catalog
+
+    workloads = [("burst", burst_size) for burst_size in args.burst] + \
+        [("constant", invoke_delay) for invoke_delay in args.delay]
+
+    steps = build_campaign(backend, args.trigger, args.runtime, workloads, args.location, catalog,
+                           {"ready_timeout": args.ready_timeout, "quiet_period": args.quiet_period,
+                            "cool_down_timeout": args.cool_down_timeout, "probe_interval": args.probe_interval})
+
+    if(args.plan):
+        for item in steps:
+            print(item["name"] + (' <- ' + ', '.join(item["depends_on"])
+                  if len(item["depends_on"]) > 0 else ''))
+    else:
+        timeline, skipped = run_campaign(steps, backend, args.budget)
+
+        os.makedirs(os.path.dirname(args.timeline) or ".", exist_ok=True)
+        timeline.to_csv(args.timeline, index=False)
+
+        makespan = timeline["end"].max() if len(timeline.index) > 0 else 0
+        busy = (timeline["end"] - timeline["start"]).sum()
+        print('Campaign finished after ' + "{:.0f}".format(makespan) + 's, ' + "{:.0f}".format(busy) +
+              's of steps run back to back')
+        if(len(skipped) > 0):
+            print('Skipped after failures: ' + ', '.join(skipped))
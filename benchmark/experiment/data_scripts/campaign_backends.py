@@ -0,0 +1,163 @@
+import os
+import subprocess
+from abc import ABC, abstractmethod
+import threading
+import time
+import zlib
+import numpy as np
+import requests
+from dotenv import dotenv_values
+from insights_cache import TIME_FORMAT, request_query
+from simulate_triggers import model_parameters, simulate
+
+# deploy.sh names some triggers differently than the telemetry and the run catalog
+DEPLOY_NAMES = {"servicebustopic": "serviceBus",
+                "eventhub": "eventHub", "eventgrid": "eventGrid"}
+
+BENCHMARK_DIR = './../..'
+EXPERIMENT_DIR = './..'
+ENV_PATH = './../../.env'
+
+
+class DeploymentBackend(ABC):
+    # Everything the campaign scheduler needs from the platform. Times are in
+    # seconds on the backend clock, so a fake backend can run faster than real time.
+
+    def environment(self, trigger, runtime):
+        # Stacks in the same environment share deployed resources and are never run at the same time
+        return (trigger, runtime)
+
+    @abstractmethod
+    def deploy(self, trigger, runtime):
+        pass
+
+    @abstractmethod
+    def is_ready(self, trigger, runtime):
+        pass
+
+    @abstractmethod
+    def run_workload(self, trigger, runtime, invoke_mode, invoke_input):
+        # Runs one workload/k6.js setting and returns once the last invocation was sent
+        pass
+
+    @abstractmethod
+    def telemetry_count(self, trigger, runtime, since):
+        # Receiver executions observed since the given backend time
+        pass
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class AzureBackend(DeploymentBackend):
+    # Deploys with deploy.sh and runs workload/k6.js like run_benchmark.sh
+
+    def __init__(self, location, benchmark_dir=BENCHMARK_DIR, experiment_dir=EXPERIMENT_DIR, env_path=ENV_PATH):
+        self.location = location
+        self.benchmark_dir = benchmark_dir
+        self.experiment_dir = experiment_dir
+        self.env_path = env_path
+        self.function_app_url = None
+        # Wall clock time of the monotonic clock origin, to convert probe times to telemetry timestamps
+        self.origin = time.time() - time.monotonic()
+
+    def environment(self, trigger, runtime):
+        # All triggers are published to the one function app of the shared stack
+        # and deploy.sh keeps a single .env, so stacks cannot overlap on Azure
+        return "shared"
+
+    def deploy(self, trigger, runtime):
+        subprocess.run(["bash", "./deploy.sh", "-t", DEPLOY_NAMES.get(trigger, trigger), "-r", runtime, "-l", self.location],
+                       cwd=self.benchmark_dir, check=True)
+        self.function_app_url = subprocess.run(["pulumi", "stack", "output", "functionAppUrl"],
+                                               cwd=os.path.join(self.benchmark_dir, "shared_resources"),
+                                               check=True, capture_output=True, text=True).stdout.strip()
+
+    def benchmark_url(self):
+        return dotenv_values(self.env_path).get("BENCHMARK_URL") or ""
+
+    def is_ready(self, trigger, runtime):
+        # The invoker must point at this trigger and the function app must answer
+        if("trigger=" + trigger not in self.benchmark_url().lower()):
+            return False
+        try:
+            return requests.get(self.function_app_url, timeout=10).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def run_workload(self, trigger, runtime, invoke_mode, invoke_input):
+        if(invoke_mode == "burst"):
+            settings = ["-e", "BURST_SIZE=" + str(invoke_input), "-e", "MODE=BURST"]
+        else:
+            settings = ["-e", "INVOKE_DELAY=" + str(invoke_input), "-e", "MODE=CONSTANT"]
+        subprocess.run(["k6", "run", "-e", "BENCHMARK_URL=" + self.benchmark_url()] + settings + ["./workload/k6.js", "--quiet"],
+                       cwd=self.experiment_dir, check=True)
+
+    def telemetry_count(self, trigger, runtime, since):
+        env = dotenv_values(self.env_path)
+        since = time.strftime(TIME_FORMAT, time.gmtime(self.origin + since))
+        # itemCount restores the executions dropped by Application Insights sampling
+        result = request_query(env.get("INSIGHTS_APP_ID"), {'x-api-key': env.get("INSIGHTS_API_KEY")},
+                               'dependencies | where timestamp >= datetime("' + since + '") | where name contains "Custom operationId ' +
+                               trigger + '" | summarize sum(itemCount)')
+        rows = result['tables'][0]['rows']
+        return int(rows[0][0] or 0) if len(rows) > 0 else 0
+
+
+class LocalBackend(DeploymentBackend):
+    # Fake platform for exercising the scheduler. Deploys take a random time,
+    # workloads are delivered with the models of simulate_triggers.py and the
+    # clock runs time_scale times faster than real time.
+
+    def __init__(self, time_scale=0.001, seed=None, models=None, deploy_seconds=(120, 600), ready_seconds=(5, 60)):
+        self.time_scale = time_scale
+        self.seed = seed if seed is not None else int(time.time())
+        self.models = models
+        self.deploy_seconds = deploy_seconds
+        self.ready_seconds = ready_seconds
+        self.lock = threading.Lock()
+        self.stacks = {}
+
+    def stack(self, trigger, runtime):
+        with self.lock:
+            if((trigger, runtime) not in self.stacks):
+                # Seeded per stack, so results do not depend on the order the stacks are scheduled in
+                self.stacks[(trigger, runtime)] = {"rng": np.random.default_rng([self.seed, zlib.crc32((trigger + "/" + runtime).encode())]),
+                                                   "ready_at": None, "workloads": []}
+            return self.stacks[(trigger, runtime)]
+
+    def deploy(self, trigger, runtime):
+        stack = self.stack(trigger, runtime)
+        self.sleep(stack["rng"].uniform(*self.deploy_seconds))
+        stack["ready_at"] = self.now() + stack["rng"].uniform(*self.ready_seconds)
+
+    def is_ready(self, trigger, runtime):
+        ready_at = self.stack(trigger, runtime)["ready_at"]
+        return ready_at is not None and self.now() >= ready_at
+
+    def run_workload(self, trigger, runtime, invoke_mode, invoke_input):
+        stack = self.stack(trigger, runtime)
+        start = self.now()
+        simulation = simulate(trigger, invoke_mode, invoke_input,
+                              model_parameters(trigger, self.models), stack["rng"])
+        received_ms = np.sort(simulation["received_ms"][~simulation["is_lost"]])
+        stack["workloads"].append((start, received_ms))
+        # k6 returns after the last invocation was sent
+        self.sleep(simulation["invoked_ms"].max() / 1000)
+
+    def telemetry_count(self, trigger, runtime, since):
+        now = self.now()
+        count = 0
+        for start, received_ms in self.stack(trigger, runtime)["workloads"]:
+            if(start >= since):
+                count = count + int(np.searchsorted(received_ms, (now - start) * 1000, side='right'))
+        return count
+
+    def now(self):
+        return time.monotonic() / self.time_scale
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0) * self.time_scale)
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+GROUP_COLUMNS = ["runtime", "trigger_type", "invoke_type", "invoke_input"]
+
+# Maximum vertical distance between the downsampled and the exact ECDF
+ECDF_MAX_ERROR = 0.002
+
+# Violin outlines are evaluated at this many points, like stat_ydensity's
+# default n, on a grid BIN_FACTOR times finer than that for the binned KDE
+DENSITY_POINTS = 1024
+BIN_FACTOR = 4
+
+# Kernel tails beyond this many bandwidths are cut off by the FFT padding
+KERNEL_CUTOFF = 6
+
+Z_95 = 1.959963984540054
+
+
+def sorted_groups(results, group_columns, value_column):
+    # Sort all values by group and value at once. Returns the group keys, the
+    # sorted values, their group codes and the first position of each group.
+    grouped = results.groupby(group_columns, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    keys = grouped.size().index
+    values = results[value_column].to_numpy(dtype=float)
+    order = np.lexsort((values, codes))
+    values = values[order]
+    codes = codes[order]
+    counts = np.bincount(codes, minlength=len(keys))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return keys.to_frame(index=False), values, codes, counts, starts
+
+
+def ecdf_table(results, group_columns=GROUP_COLUMNS, value_column="latency", max_error=ECDF_MAX_ERROR):
+    # ECDF of every group at its unique values, reduced to the first and last
+    # point of every max_error wide band of ECDF values. Between two kept
+    # points the exact ECDF either has no points or stays within one band, so
+    # the line through the kept points is never more than max_error off.
+    keys, values, codes, counts, starts = sorted_groups(
+        results, group_columns, value_column)
+    if(len(values) == 0):
+        return pd.DataFrame(columns=group_columns + [value_column, "ecdf"])
+
+    rank = np.arange(1, len(values) + 1) - starts[codes]
+    ecdf = rank / counts[codes]
+
+    # Ties share the ECDF value of their last occurrence
+    is_last = np.ones(len(values), dtype=bool)
+    is_last[:-1] = (values[1:] != values[:-1]) | (codes[1:] != codes[:-1])
+    values, codes, ecdf = values[is_last], codes[is_last], ecdf[is_last]
+
+    band = np.floor(ecdf / max_error)
+    is_new = np.ones(len(values), dtype=bool)
+    is_new[1:] = (band[1:] != band[:-1]) | (codes[1:] != codes[:-1])
+    is_end = np.ones(len(values), dtype=bool)
+    is_end[:-1] = is_new[1:]
+    keep = is_new | is_end
+
+    table = keys.iloc[codes[keep]].reset_index(drop=True)
+    table[value_column] = values[keep]
+    table["ecdf"] = ecdf[keep]
+    return table
+
+
+def group_quantiles(values, counts, starts, q):
+    # Linearly interpolated quantiles of sorted groups, as numpy.percentile
+    position = q * (counts - 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, counts - 1)
+    fraction = position - below
+    return values[starts + below] * (1 - fraction) + values[starts + above] * fraction
+
+
+def nrd0(values, codes, counts, starts):
+    # Vectorized port of plotnine's nrd0 (R stats::bw.nrd0) for every group
+    sums = np.bincount(codes, weights=values, minlength=len(counts))
+    means = sums / counts
+    squares = np.bincount(codes, weights=(
+        values - means[codes]) ** 2, minlength=len(counts))
+    std = np.sqrt(squares / np.maximum(counts - 1, 1))
+    std_estimate = (group_quantiles(values, counts, starts, 0.75) -
+                    group_quantiles(values, counts, starts, 0.25)) / 1.349
+    low_std = np.minimum(std, std_estimate)
+    fallback = np.where(std_estimate > 0, std_estimate,
+                        np.where(values[starts] != 0, np.abs(values[starts]), 1))
+    low_std = np.where(low_std == 0, fallback, low_std)
+    return 0.9 * low_std * counts.astype(float) ** -0.2
+
+
+def density_table(results, group_columns=GROUP_COLUMNS, value_column="latency", points=DENSITY_POINTS, log=True, adjust=1, min_bandwidth=0):
+    # Gaussian KDE with the nrd0 bandwidth (times adjust, at least
+    # min_bandwidth) of every group on points equally spaced from its minimum
+    # to its maximum, as geom_violin draws it. log estimates the density of
+    # log10 values, as on a scale_y_log10 axis.
+    # Values are linearly binned onto a fine grid per group and all groups are
+    # smoothed with one batched FFT, so the cost does not depend on the
+    # number of samples beyond the binning.
+    data = results[results[value_column] > 0] if log else results
+    data = data[data.groupby(group_columns)[value_column].transform("size") > 1]
+    if(len(data.index) == 0):
+        return pd.DataFrame(columns=group_columns + [value_column, "density"])
+    if(log):
+        data = data.assign(**{value_column: np.log10(data[value_column])})
+
+    keys, values, codes, counts, starts = sorted_groups(
+        data, group_columns, value_column)
+    groups = len(counts)
+    bandwidth = np.maximum(nrd0(values, codes, counts, starts) * adjust, min_bandwidth)
+    low = values[starts]
+    high = values[starts + counts - 1]
+    span = high - low
+
+    bins = (points - 1) * BIN_FACTOR + 1
+    step = np.where(span > 0, span / (bins - 1), 1.0)
+    sigma = bandwidth / step
+    length = int(2 ** np.ceil(np.log2(bins + KERNEL_CUTOFF *
+                 min(sigma.max(), 4 * bins) + 1)))
+
+    position = (values - low[codes]) / step[codes]
+    left = np.minimum(np.floor(position).astype(np.int64), bins - 1)
+    fraction = position - left
+    binned = np.bincount(codes * length + left, weights=1 - fraction,
+                         minlength=groups * length) + \
+        np.bincount(codes * length + np.minimum(left + 1, length - 1), weights=fraction,
+                    minlength=groups * length)
+    binned = binned.reshape(groups, length)
+
+    # Smoothing with the Fourier transform of the gaussian kernel
+    frequency = np.fft.rfftfreq(length)
+    kernel = np.exp(-2 * np.pi ** 2 *
+                    (sigma[:, np.newaxis] * frequency[np.newaxis, :]) ** 2)
+    smoothed = np.fft.irfft(np.fft.rfft(binned, axis=1) * kernel, n=length, axis=1)
+    density = np.maximum(smoothed[:, 0:bins:BIN_FACTOR], 0) / \
+        (counts * step)[:, np.newaxis]
+
+    # Groups without spread have no outline, only their single value
+    is_flat = span == 0
+    density[is_flat] = 0
+
+    grid = low[:, np.newaxis] + np.arange(points)[np.newaxis, :] * \
+        np.where(is_flat, 0, step * BIN_FACTOR)[:, np.newaxis]
+
+    table = keys.iloc[np.repeat(np.arange(groups), points)].reset_index(drop=True)
+    table[value_column] = 10 ** grid.ravel() if log else grid.ravel()
+    table["density"] = density.ravel()
+    return table
+
+
+def mean_table(results, group_columns=GROUP_COLUMNS, value_column="latency", log=True):
+    # Mean with a normal 95% confidence interval per group, the large sample
+    # limit of mean_cl_boot. log summarizes log10 values like stat_summary
+    # does on a scale_y_log10 axis and transforms the result back.
+    data = results[results[value_column] > 0] if log else results
+    values = np.log10(data[value_column]) if log else data[value_column]
+    summary = values.groupby([data[column] for column in group_columns]).agg(
+        ["mean", "std", "size"]).reset_index()
+    # The bootstrap resamples with the population standard deviation
+    error = Z_95 * summary["std"].fillna(0) * np.sqrt(
+        (summary["size"] - 1) / summary["size"]) / np.sqrt(summary["size"])
+    table = summary[group_columns].copy()
+    for column, value in [(value_column, summary["mean"]), (value_column + "_low", summary["mean"] - error),
+                          (value_column + "_high", summary["mean"] + error)]:
+        table[column] = 10 ** value if log else value
+    return table
+
+
+def violin_widths(density, panel_columns):
+    # geom_violin with scale="area" scales all outlines of a panel by the panel's largest density
+    return density["density"] / density.groupby(panel_columns)["density"].transform("max")
@@ -12,9 +12,41 @@ import os
 from dotenv import load_dotenv
 from datetime import date
 from datetime import timedelta
+import argparse
 import pandas as pd
 import numpy as np
 import sys
+from insights_cache import query_insights_windows, TIME_FORMAT, CACHE_MAX_BYTES
+from run_catalog import CATALOG_PATH, connect, selected_runs, fetch_windows, filter_entries
+import profiling
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-no_cache", "--no_cache", action="store_true",
+                    help="Bypass the query result cache and always fetch from Application Insights")
+parser.add_argument("-cache_size", "--cache_size", type=float, default=CACHE_MAX_BYTES / (1024 * 1024),
+                    help="Maximum size of the query result cache in MB")
+parser.add_argument("-runs", "--runs", nargs="+",
+                    help="Ids of the cataloged runs to fetch")
+parser.add_argument("-trigger", "--trigger",
+                    help="Fetch all cataloged runs of this trigger")
+parser.add_argument("-runtime", "--runtime",
+                    help="Fetch all cataloged runs of this runtime")
+parser.add_argument("-mode", "--mode",
+                    help="Fetch all cataloged runs of this invoke mode")
+parser.add_argument("-input", "--input", type=int,
+                    help="Fetch all cataloged runs of this invoke input")
+parser.add_argument("-catalog", "--catalog", default=CATALOG_PATH,
+                    help="Path to the run catalog")
+parser.add_argument("-start", "--start",
+                    help="Start of a window to fetch without the catalog, " + TIME_FORMAT + " UTC")
+parser.add_argument("-end", "--end",
+                    help="End of a window to fetch without the catalog, " + TIME_FORMAT + " UTC")
+profiling.add_profile_arguments(parser)
+
+args = parser.parse_args()
+
+profiling.configure(args, "fetch_traces")
 
 # Set it None to display all rows in the dataframe
 pd.set_option('display.max_rows', None)
@@ -49,27 +81,66 @@ def print_progress(current, total):
     sys.stdout.flush()
 
 
+def item_count_index(table):
+    # Column of the Application Insights sampling weight, None if the query result has no such column
+    column_names = [column['name'] for column in table['columns']]
+    if('itemCount' in column_names):
+        return column_names.index('itemCount')
+    return None
+
+
+def item_count(value, index):
+    if(index is None or value[index] is None):
+        return 1
+    return int(value[index])
+
+
+runs = None
+if(args.runs is not None or args.trigger is not None or args.runtime is not None or args.mode is not None or args.input is not None):
+    runs = selected_runs(parser, connect(args.catalog), run_ids=args.runs, trigger=args.trigger,
+                         runtime=args.runtime, invoke_mode=args.mode, invoke_input=args.input)
+    print('Fetching ' + str(len(runs.index)) + ' cataloged runs')
+    windows = fetch_windows(runs)
+else:
+    if(args.start is not None):
+        start_date, start_time = args.start.split(" ")
+    if(args.end is not None):
+        end_date, end_time = args.end.split(" ")
+    windows = [(datetime.strptime(start_date + " " + start_time, TIME_FORMAT),
+                datetime.strptime(end_date + " " + end_time, TIME_FORMAT))]
+
+cache_max_bytes = int(args.cache_size * 1024 * 1024)
+
 print('')
 print('Fetching Requests...')
-reqs = requests.get('https://api.applicationinsights.io/v1/apps/' +
-                    application_ID + '/query?query=requests | where timestamp between(datetime("' + start_date + " " + start_time + '") .. datetime("' + end_date + " " + end_time + '"))', headers=headers)
+profiling.start_stage("fetch_requests")
+reqs = query_insights_windows(application_ID, headers, 'requests', windows,
+                              use_cache=not args.no_cache, max_bytes=cache_max_bytes)
 
-reqs = reqs.json()
+profiling.end_stage(rows_out=len(reqs["tables"][0]["rows"]))
 
 print('')
 print('Fetching Dependencies...')
-dependencies = requests.get('https://api.applicationinsights.io/v1/apps/' +
-                            application_ID + '/query?query=dependencies | where name contains "Custom operationId" or name contains "CompletionTrack" or name contains "GET /api/httptrigger" | where timestamp between(datetime("' + start_date + " " + start_time + '") .. datetime("' + end_date + " " + end_time + '"))', headers=headers)
-dependencies = dependencies.json()
+profiling.start_stage("fetch_dependencies")
+dependencies = query_insights_windows(application_ID, headers, 'dependencies | where name contains "Custom operationId" or name contains "CompletionTrack" or name contains "GET /api/httptrigger"', windows,
+                                      use_cache=not args.no_cache, max_bytes=cache_max_bytes)
+
+profiling.end_stage(rows_out=len(dependencies["tables"][0]["rows"]))
 
 print('')
 print('Fetching Traces...')
-traces = requests.get('https://api.applicationinsights.io/v1/apps/' +
-                      application_ID + '/query?query=traces     | where message contains "InvokerEndpoint details" or message contains "Coldstart details" | extend iteration_id = tostring(customDimensions.["iteration_id"]) | where iteration_id == "1" or iteration_id == "" | where timestamp between(datetime("' + start_date + " " + start_time + '") .. datetime("' + end_date + " " + end_time + '"))', headers=headers)
-traces = traces.json()
+profiling.start_stage("fetch_traces")
+traces = query_insights_windows(application_ID, headers, 'traces     | where message contains "InvokerEndpoint details" or message contains "Coldstart details" | extend iteration_id = tostring(customDimensions.["iteration_id"]) | where iteration_id == "1" or iteration_id == ""', windows,
+                                use_cache=not args.no_cache, max_bytes=cache_max_bytes)
+
+profiling.end_stage(rows_out=len(traces["tables"][0]["rows"]))
+
+print('')
+print('Reused ' + str(reqs['cached_slices'] + dependencies['cached_slices'] + traces['cached_slices']) +
+      ' cached query slices')
 
 all_entries = pd.DataFrame(
-    columns=['type', 'name', 'timestamp', 'operation_id', 'runtime', 'trigger', 'duration', 'iteration_id', 'invoke_mode', 'invoke_input'])
+    columns=['type', 'name', 'timestamp', 'operation_id', 'runtime', 'trigger', 'duration', 'iteration_id', 'invoke_mode', 'invoke_input', 'item_count'])
 
 trigger_pick = ["http", "storage", "queue",
                 "database", "eventhub", "eventgrid", "servicebustopic"]
@@ -83,8 +154,10 @@ switch_operation_ids = []
 
 print('')
 print('Extracting Requests...')
+profiling.start_stage("extract_requests", rows_in=len(reqs["tables"][0]["rows"]))
 entries = []
 total_length = len(reqs["tables"][0]["rows"])
+count_index = item_count_index(reqs["tables"][0])
 count = -1
 for value in reqs["tables"][0]["rows"]:
     count = count + 1
@@ -114,15 +187,20 @@ for value in reqs["tables"][0]["rows"]:
             break
 
     d['duration'] = value[8]
+    d['item_count'] = item_count(value, count_index)
 
     entries.append(d)
 
 all_entries = all_entries.append(entries, ignore_index=True)
+profiling.end_stage(rows_out=len(entries))
 
 print('')
 print('Extracting Dependencies...')
+profiling.start_stage("extract_dependencies", rows_in=len(
+    dependencies["tables"][0]["rows"]))
 entries = []
 total_length = len(dependencies["tables"][0]["rows"])
+count_index = item_count_index(dependencies["tables"][0])
 count = -1
 for value in dependencies["tables"][0]["rows"]:
     count = count + 1
@@ -150,13 +228,16 @@ for value in dependencies["tables"][0]["rows"]:
     d['type'] = 'DEPENDENCY'
     d['timestamp'] = timestamp
     d['duration'] = value[8]
+    d['item_count'] = item_count(value, count_index)
     entries.append(d)
 
 all_entries = all_entries.append(entries, ignore_index=True)
+profiling.end_stage(rows_out=len(entries))
 
 # Switch operation ids if necessary
 print('')
 print('Setting correct operation IDs...')
+profiling.start_stage("switch_operation_ids", rows_in=len(all_entries.index))
 total_length = len(switch_operation_ids)
 count = -1
 if len(switch_operation_ids) > 0:
@@ -166,10 +247,14 @@ if len(switch_operation_ids) > 0:
         all_entries["operation_id"].replace(
             switch[1], switch[0].replace('|', '').split('.')[0], inplace=True)
 
+profiling.end_stage(rows_out=len(all_entries.index))
+
 print('')
 print('Extracting Traces...')
+profiling.start_stage("extract_traces", rows_in=len(traces["tables"][0]["rows"]))
 entries = []
 total_length = len(traces["tables"][0]["rows"])
+count_index = item_count_index(traces["tables"][0])
 count = -1
 
 for value in traces["tables"][0]["rows"]:
@@ -192,18 +277,27 @@ for value in traces["tables"][0]["rows"]:
         d['name'] = 'cold start'
         d['timestamp'] = timestamp
         d['operation_id'] = value[7]
+        d['item_count'] = item_count(value, count_index)
         entries.append(d)
 all_entries = all_entries.append(entries, ignore_index=True)
+profiling.end_stage(rows_out=len(all_entries.index))
 
 # Remove entries without operation_id
 # all_entries = all_entries.filter(
 #    all_entries["operation_id"][all_entries["operation_id"] == ""])
 
+profiling.start_stage("write", rows_in=len(all_entries.index))
+
+# Drop telemetry of other settings that ran concurrently with the selected runs
+if(runs is not None):
+    all_entries = filter_entries(all_entries, runs)
+
 all_entries = all_entries.sort_values(by=['timestamp'])
 print('')
 print("Writing data to CSV-files...")
 for runtime_type in runtime_pick:
     all_entries.loc[all_entries['runtime'] == runtime_type].to_csv(
         "./../raw_data/" + runtime_type + ".csv", index=False)
+profiling.end_stage(rows_out=len(all_entries.index))
 print('')
 print("Finished")
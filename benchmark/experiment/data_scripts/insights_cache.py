@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+import requests
+
+INSIGHTS_QUERY_URL = 'https://api.applicationinsights.io/v1/apps/{}/query'
+
+CACHE_DIR = './../cache/insights'
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Telemetry is stable a few minutes after it was sent (see README), windows
+# that ended longer ago than this are closed and their results never change
+STABLE_DELAY = timedelta(minutes=10)
+
+# Long windows are fetched and cached in slices on whole hours so that
+# overlapping fetches share slices and a failed fetch only repeats the
+# missing ones
+SLICE_LENGTH = timedelta(hours=1)
+
+THROTTLE_RETRIES = 5
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def cache_key(app_id, query, start, end):
+    key = json.dumps([app_id, normalize_query(query),
+                     start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[0:2], key + '.json.gz')
+
+
+def time_slices(start, end, slice_length=SLICE_LENGTH):
+    # Slice boundaries are multiples of slice_length since midnight, so that
+    # windows of different run selections share their inner slices. Only
+    # the first and last slice are clipped to the window.
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    slices = []
+    slice_start = start
+    slice_end = midnight + ((start - midnight) // slice_length + 1) * slice_length
+    while slice_start < end:
+        slices.append((slice_start, min(slice_end, end)))
+        slice_start = slice_end
+        slice_end = slice_end + slice_length
+    return slices
+
+
+def is_closed(end, now=None):
+    if(now is None):
+        now = datetime.utcnow()
+    return end <= now - STABLE_DELAY
+
+
+def read_cache(path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            result = json.load(file)
+    except (OSError, ValueError):
+        return None
+    # Reading counts as use for the LRU eviction
+    os.utime(path)
+    return result
+
+
+def write_cache(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as file:
+        json.dump(result, file)
+    os.replace(temp_path, path)
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # Scans the whole cache, call it once after a fetch rather than per write
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if(name.endswith('.json.gz')):
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, stat.st_size,
+                               os.path.join(root, name)))
+
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, path in sorted(entries):
+        if(total_size <= max_bytes):
+            break
+        os.remove(path)
+        total_size = total_size - size
+
+
+def request_query(app_id, headers, query):
+    for attempt in range(THROTTLE_RETRIES):
+        response = requests.get(INSIGHTS_QUERY_URL.format(app_id),
+                                params={'query': query}, headers=headers)
+        if(response.status_code != 429):
+            break
+        time.sleep(int(response.headers.get('Retry-After', 2 ** attempt)))
+    response.raise_for_status()
+    return response.json()
+
+
+def query_window(app_id, headers, query, start, end, use_cache=True, cache_dir=CACHE_DIR):
+    windowed_query = query + ' | where timestamp >= datetime("' + start.strftime(TIME_FORMAT) + \
+        '") and timestamp < datetime("' + end.strftime(TIME_FORMAT) + '")'
+
+    path = cache_path(cache_key(app_id, query, start, end), cache_dir)
+    if(use_cache):
+        result = read_cache(path)
+        if(result is not None):
+            return result, True
+
+    result = request_query(app_id, headers, windowed_query)
+    # Open windows may still receive telemetry and are always refetched
+    if(use_cache and is_closed(end)):
+        write_cache(path, result)
+    return result, False
+
+
+def query_insights(app_id, headers, query, start, end, use_cache=True, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # Fetch all slices of [start, end) and merge them into one query result
+    return query_insights_windows(app_id, headers, query, [(start, end)], use_cache, cache_dir, max_bytes)
+
+
+def query_insights_windows(app_id, headers, query, windows, use_cache=True, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # Fetch all slices of disjoint windows, e.g. the windows of the selected
+    # benchmark runs, into one query result. The cache is trimmed to
+    # max_bytes once all slices are written.
+    merged = None
+    cached_slices = 0
+    for start, end in windows:
+        for slice_start, slice_end in time_slices(start, end):
+            result, is_cached = query_window(app_id, headers, query, slice_start, slice_end,
+                                             use_cache, cache_dir)
+            cached_slices = cached_slices + int(is_cached)
+            if(merged is None):
+                merged = result
+            else:
+                merged['tables'][0]['rows'].extend(result['tables'][0]['rows'])
+
+    if(use_cache):
+        evict_cache(cache_dir, max_bytes)
+
+    if(merged is None):
+        merged = {'tables': [{'name': 'PrimaryResult', 'columns': [], 'rows': []}]}
+    merged['cached_slices'] = cached_slices
+    return merged
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+from distributions import GROUP_COLUMNS, DENSITY_POINTS, sorted_groups, nrd0, density_table
+
+# The nrd0 bandwidth smooths over close modes, half of it separates them.
+# Latencies are whole milliseconds, a narrower kernel makes every value a mode.
+BANDWIDTH_ADJUST = 0.5
+RESOLUTION_MS = 1
+
+# A mode must rise this many standard deviations of the sampling noise above
+# the valleys around it, and hold at least this share of the group's samples
+MIN_SIGNIFICANCE = 3
+MIN_WEIGHT = 0.02
+MAX_MODES = 8
+
+# Settings that move the delivery modes of each trigger
+TUNING_SETTINGS = {
+    "queue": "host.json queues.maxPollingInterval, queues.batchSize",
+    "storage": "blob trigger source (EventGrid instead of container polling)",
+    "database": "function.json feedPollDelay, maxItemsPerInvocation",
+    "eventhub": "host.json eventHubs.maxEventBatchSize, eventHubs.maxWaitTime",
+    "servicebustopic": "host.json serviceBus.maxConcurrentCalls, serviceBus.prefetchCount"
+}
+
+TREND_COLUMNS = ["runtime", "trigger_type", "invoke_type"]
+
+
+def _valleys(heights, grid, peaks):
+    # Lowest point between every two consecutive peaks, +inf after the last
+    boundaries = np.full((len(peaks), MAX_MODES - 1), np.inf)
+    for group in range(len(peaks)):
+        found = peaks[group][peaks[group] >= 0]
+        for i in range(len(found) - 1):
+            boundaries[group, i] = grid[group, found[i] +
+                                        np.argmin(heights[group, found[i]:found[i + 1] + 1])]
+    return boundaries
+
+
+def _shares(values, codes, weights, boundaries):
+    # Share of every group's weight in the basin of each of its peaks
+    groups = len(boundaries)
+    mode = (values[:, np.newaxis] > boundaries[codes]).sum(axis=1)
+    mass = np.bincount(codes * MAX_MODES + mode, weights=weights,
+                       minlength=groups * MAX_MODES).reshape(groups, MAX_MODES)
+    return mass / mass.sum(axis=1, keepdims=True)
+
+
+def mode_table(results, group_columns=GROUP_COLUMNS, value_column="latency", weight_column="weight",
+               adjust=BANDWIDTH_ADJUST, significance=MIN_SIGNIFICANCE, min_weight=MIN_WEIGHT, points=DENSITY_POINTS):
+    # Modes of every group: the peaks of a narrow KDE of the latencies, with
+    # the bounds and (sampling weighted) share of the samples around each
+    # peak and the distance to the previous mode
+    columns = group_columns + ["mode", value_column, value_column + "_low", value_column + "_high",
+                               "weight", "spacing"]
+    # The key columns are grouped once, everything else groups by their code
+    grouped = results.groupby(group_columns, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    keys = grouped.size().index.to_frame(index=False)
+    is_spread = (np.bincount(codes, minlength=len(keys.index)) > 1)[codes]
+    data = pd.DataFrame({"group": codes[is_spread],
+                         value_column: results[value_column].to_numpy(dtype=float)[is_spread],
+                         "weight": results[weight_column].to_numpy(dtype=float)[is_spread]
+                         if weight_column in results.columns else 1.0})
+    if(len(data.index) == 0):
+        return pd.DataFrame(columns=columns)
+
+    # All groups are smoothed at once, peaks are then found per group on the
+    # fixed grid, so only the binning depends on the number of samples.
+    # Polling and batching space the modes linearly, so unlike the violins
+    # the KDE is not taken of log10 values.
+    density = density_table(data, ["group"], value_column, points, log=False, adjust=adjust,
+                            min_bandwidth=RESOLUTION_MS)
+    grid = density[value_column].to_numpy(dtype=float).reshape(-1, points)
+    heights = density["density"].to_numpy(dtype=float).reshape(-1, points)
+    present = density["group"].to_numpy()[::points]
+    keys = keys.iloc[present].reset_index(drop=True)
+    groups = len(keys.index)
+
+    # Expected sample counts within one bandwidth of every grid point
+    _, sorted_values, sorted_codes, counts, starts = sorted_groups(data, ["group"], value_column)
+    bandwidth = np.maximum(nrd0(sorted_values, sorted_codes, counts, starts) * adjust, RESOLUTION_MS)
+    expected = heights * (counts * 2 * bandwidth)[:, np.newaxis]
+
+    peaks = np.full((groups, MAX_MODES), -1)
+    for group in range(groups):
+        if(heights[group].max() <= 0):
+            # Groups without spread have their single value as only mode
+            peaks[group, 0] = 0
+            continue
+        # Zero padding lets the grid edges be peaks
+        found = find_peaks(np.concatenate([[0], heights[group], [0]]))[0] - 1
+        curve = expected[group]
+        while(len(found) > 1):
+            # Merge the least significant peak until every peak rises above
+            # the higher valley next to it by more than the sampling noise
+            valleys = np.minimum.reduceat(curve, found)[:-1]
+            valley = np.maximum(np.concatenate([[0], valleys]), np.concatenate([valleys, [0]]))
+            score = (curve[found] - valley) / np.sqrt(curve[found] + valley)
+            weakest = np.argmin(score)
+            if(score[weakest] >= significance and len(found) <= MAX_MODES):
+                break
+            found = np.delete(found, weakest)
+        peaks[group, :len(found)] = found
+
+    values = data[value_column].to_numpy()
+    codes = np.searchsorted(present, data["group"].to_numpy())
+    weights = data["weight"].to_numpy()
+
+    # Peaks holding too few samples are merged into their neighbours, the
+    # heaviest peak of a group is always kept
+    shares = _shares(values, codes, weights, _valleys(heights, grid, peaks))
+    heaviest = np.argmax(np.where(peaks >= 0, shares, -1), axis=1)
+    is_top = np.arange(MAX_MODES)[np.newaxis, :] == heaviest[:, np.newaxis]
+    is_kept = (peaks >= 0) & ((shares >= min_weight) | is_top)
+    order = np.argsort(~is_kept, axis=1, kind="stable")
+    peaks = np.where(np.take_along_axis(is_kept, order, axis=1),
+                     np.take_along_axis(peaks, order, axis=1), -1)
+    boundaries = _valleys(heights, grid, peaks)
+    shares = _shares(values, codes, weights, boundaries)
+
+    group, mode = np.nonzero(peaks >= 0)
+    low = np.concatenate([np.full((groups, 1), -np.inf), boundaries], axis=1)[group, mode]
+    high = np.concatenate([boundaries, np.full((groups, 1), np.inf)], axis=1)[group, mode]
+    location = grid[group, peaks[group, mode]]
+
+    table = keys.iloc[group].reset_index(drop=True)
+    table["mode"] = mode + 1
+    table[value_column] = location
+    table[value_column + "_low"] = np.maximum(low, grid[group, 0])
+    table[value_column + "_high"] = np.minimum(high, grid[group, -1])
+    table["weight"] = shares[group, mode]
+    previous = np.concatenate([[np.nan], location[:-1]])
+    table["spacing"] = np.where(mode > 0, location - previous, np.nan)
+    return table[columns]
+
+
+def modality_table(modes, group_columns=GROUP_COLUMNS, value_column="latency"):
+    # One row per group: number of modes, the heaviest mode, the median
+    # spacing of the modes and how far the heaviest mode moved from the
+    # previous burst size or inter-arrival time
+    grouped = modes.groupby(group_columns, sort=True)
+    primary = modes.loc[grouped["weight"].idxmax()].reset_index(drop=True)
+    table = primary[group_columns].copy()
+    table["modes"] = grouped.size().to_numpy()
+    table["primary_" + value_column] = primary[value_column].to_numpy()
+    table["primary_weight"] = primary["weight"].to_numpy()
+    table["mode_spacing"] = grouped["spacing"].median().to_numpy()
+    trend_columns = [column for column in group_columns if column in TREND_COLUMNS]
+    table["primary_shift"] = table["primary_" + value_column] / \
+        table.groupby(trend_columns)["primary_" + value_column].shift(1)
+    table["tuning"] = np.where(table["modes"] > 1,
+                               table["trigger_type"].map(TUNING_SETTINGS).fillna(""), "")
+    return table
+
+
+def _slope(x, y):
+    if(len(x) < 2 or np.ptp(x) == 0):
+        return np.nan
+    if(np.ptp(y) == 0):
+        return 0.0
+    return np.polyfit(x, y, 1)[0]
+
+
+def trend_table(modality, value_column="latency"):
+    # Per trigger, runtime and workload type: how many burst sizes or
+    # inter-arrival times are multi-modal, their typical mode spacing, and
+    # the slopes of the heaviest mode (log-log) and the mode count (over
+    # log10 input) against the burst size or inter-arrival time
+    rows = []
+    for (runtime, trigger_type, invoke_type), group in modality.groupby(TREND_COLUMNS):
+        log_input = np.log10(group["invoke_input"].to_numpy(dtype=float))
+        multimodal = group[group["modes"] > 1]
+        rows.append({"runtime": runtime, "trigger_type": trigger_type, "invoke_type": invoke_type,
+                     "inputs": len(group.index), "multimodal_inputs": len(multimodal.index),
+                     "max_modes": group["modes"].max(),
+                     "mode_spacing": multimodal["mode_spacing"].median(),
+                     "primary_elasticity": _slope(log_input, np.log10(group["primary_" + value_column].to_numpy(dtype=float))),
+                     "modes_slope": _slope(log_input, group["modes"].to_numpy(dtype=float)),
+                     "tuning": TUNING_SETTINGS.get(trigger_type, "") if len(multimodal.index) > 0 else ""})
+    return pd.DataFrame(rows, columns=TREND_COLUMNS + ["inputs", "multimodal_inputs", "max_modes", "mode_spacing",
+                                                       "primary_elasticity", "modes_slope", "tuning"])
@@ -2,6 +2,19 @@ import pandas as pd
 import numpy as np
 import plotnine as p9
 import os.path as os
+import argparse
+from distributions import ecdf_table, density_table, mean_table, violin_widths
+import profiling
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-recompute", "--recompute", action="store_true",
+                    help="Recompute the ECDF and violin tables even if they are newer than the results")
+profiling.add_profile_arguments(parser)
+
+args = parser.parse_args()
+
+profiling.configure(args, "plot_latency")
 
 
 def format_labels(breaks):
@@ -57,10 +70,68 @@ def format_label_name_all(breaks):
         return "Event Grid"
 
 
-latency_results = pd.read_csv(
-    './../results/latency/results.csv', delimiter=",")
+results_path = './../results/latency/results.csv'
+table_paths = {"ecdf": './../results/latency/ecdf.csv',
+               "violin": './../results/latency/violin.csv',
+               "violin_summary": './../results/latency/violin_summary.csv'}
+
+# The plots draw from compact per-group tables instead of the raw samples, so
+# plotting takes the same time and the PDFs the same size for any run length.
+# The tables are recomputed when the results changed.
+is_stale = args.recompute or any(not os.exists(table_path) or os.getmtime(table_path) < os.getmtime(results_path)
+                                 for table_path in table_paths.values())
+
+if(is_stale):
+    profiling.start_stage("load")
+
+    latency_results = pd.read_csv(results_path, delimiter=",")
+
+    profiling.end_stage(rows_out=len(latency_results.index))
+    profiling.start_stage("precompute", rows_in=len(latency_results.index))
+
+    tables = {"ecdf": ecdf_table(latency_results),
+              "violin": density_table(latency_results),
+              "violin_summary": mean_table(latency_results)}
+    for name, table in tables.items():
+        table.to_csv(table_paths[name], index=False)
+
+    profiling.end_stage(rows_out=sum(len(table.index)
+                        for table in tables.values()))
+else:
+    profiling.start_stage("load")
+
+    tables = {name: pd.read_csv(table_path)
+              for name, table_path in table_paths.items()}
+
+    profiling.end_stage(rows_out=sum(len(table.index)
+                        for table in tables.values()))
+
+latency_ecdf = tables["ecdf"]
+latency_violin = tables["violin"]
+latency_violin_summary = tables["violin_summary"]
 
-latency_runtime_groups = latency_results.groupby('runtime')
+
+def violins(violin, summary, facet_column):
+    # Outlines scaled like geom_violin(scale="area") within each facet
+    violin = violin.copy()
+    violin["violinwidth"] = violin_widths(violin, [facet_column])
+    violin.rename(columns={'runtime': 'Runtime'}, inplace=True)
+    summary = summary.rename(columns={'runtime': 'Runtime'})
+    return violin, summary
+
+
+def select_inputs(table, selection):
+    # Rows of the given (invoke_type, invoke_input) pairs
+    mask = np.zeros(len(table.index), dtype=bool)
+    for invoke_type, invoke_input in selection:
+        mask = mask | ((table['invoke_type'] == invoke_type) &
+                       (table['invoke_input'] == invoke_input))
+    return table[mask]
+
+
+profiling.start_stage("cdf_all", rows_in=len(latency_ecdf.index))
+
+latency_runtime_groups = latency_ecdf.groupby('runtime')
 
 for runtime, runtime_group in latency_runtime_groups:
 
@@ -82,9 +153,9 @@ for runtime, runtime_group in latency_runtime_groups:
         invoke_type_group = invoke_type_group.astype(
             {"invoke_input": 'category'}, errors='raise')
 
-        plot = (p9.ggplot(invoke_type_group, p9.aes(x='latency', fill='invoke_input', colour='invoke_input')) + p9.labs(title="", y="CDF", x="Duration Time (milliseconds)")
+        plot = (p9.ggplot(invoke_type_group, p9.aes(x='latency', y='ecdf', fill='invoke_input', colour='invoke_input')) + p9.labs(title="", y="CDF", x="Duration Time (milliseconds)")
                 + p9.theme(legend_position="top", plot_margin=0)
-                + p9.stat_ecdf(geom="line", alpha=0.9, size=0.7)
+                + p9.geom_line(alpha=0.9, size=0.7)
                 + p9.labs(fill=legend_title, colour=legend_title)
                 + p9.scale_x_log10(labels=format_labels)
                 + p9.scale_color_brewer(type="qual",
@@ -98,9 +169,11 @@ for runtime, runtime_group in latency_runtime_groups:
             str(runtime) + "_"
             + str(invoke_type) + ".pdf")
 
+profiling.end_stage()
+profiling.start_stage("violin_baseline", rows_in=len(latency_violin.index))
 
-baseline = latency_results[((latency_results['invoke_type'] == 'burst') & (latency_results['invoke_input'] == 1)) |
-                           ((latency_results['invoke_type'] == 'constant') & (latency_results['invoke_input'] == 250))]
+baseline, baseline_summary = violins(select_inputs(latency_violin, [("burst", 1), ("constant", 250)]),
+                                     select_inputs(latency_violin_summary, [("burst", 1), ("constant", 250)]), 'invoke_input')
 
 
 def format_title(title):
@@ -110,69 +183,70 @@ def format_title(title):
         return "IAT with 250ms"
 
 
-baseline.rename(columns={'runtime': 'Runtime'}, inplace=True)
-
-
 plot = (p9.ggplot(baseline, p9.aes(fill="Runtime",
                                    x="trigger_type", y="latency"))
         + p9.labs(title="", x="Trigger Type", y="Latency (milliseconds)")
         + p9.theme(axis_text_x=p9.element_text(angle=45,
                                                hjust=1), legend_position="top")
-        + p9.geom_violin(position=p9.position_dodge(1), width=1)
+        + p9.geom_violin(p9.aes(violinwidth="violinwidth"), stat="identity", position=p9.position_dodge(1), width=1)
         + p9.scale_y_log10(labels=format_labels)
         + p9.scale_x_discrete(labels=format_label_name)
         + p9.scale_fill_brewer(type="seq",  palette="YlGnBu",
                                direction=-1, labels=format_names)
-        + p9.stat_summary(fun_data="mean_cl_boot", show_legend=False,
-                          size=0.2, width=0.5, geom="crossbar", color='gray',
-                          position=p9.position_dodge(1))
+        + p9.geom_crossbar(p9.aes(ymin="latency_low", ymax="latency_high"), data=baseline_summary, show_legend=False,
+                           size=0.2, width=0.5, color='gray',
+                           position=p9.position_dodge(1))
         + p9.facet_wrap('invoke_input', nrow=1, labeller=format_title))
 
 p9.save_as_pdf_pages(
     [plot], filename="./../results/latency/plots/violin/latency_violin_baseline.pdf")
 
+profiling.end_stage()
+profiling.start_stage("violin_all", rows_in=len(latency_violin.index))
 
-latency_invoke_type_groups = latency_results.groupby('invoke_type')
 
-for invoke_type, invoke_type_group in latency_invoke_type_groups:
+latency_invoke_type_groups = latency_violin.groupby('invoke_type')
 
-    invoke_type_group.rename(columns={'runtime': 'Runtime'}, inplace=True)
+for invoke_type, invoke_type_group in latency_invoke_type_groups:
 
     if(invoke_type == "burst"):
-        invoke_type_group = invoke_type_group[(invoke_type_group['invoke_input'] == 1) | (
-            invoke_type_group['invoke_input'] == 300)]
+        selection = [(invoke_type, 1), (invoke_type, 300)]
         rows = 1
 
         def format_title(title):
             return title + " invocations per burst"
 
     elif(invoke_type == "constant"):
-        invoke_type_group = invoke_type_group[(invoke_type_group['invoke_input'] == 250) | (
-            invoke_type_group['invoke_input'] == 1)]
+        selection = [(invoke_type, 250), (invoke_type, 1)]
         rows = 1
 
         def format_title(title):
             return "IAT with " + title + "ms"
 
+    invoke_type_group, invoke_type_summary = violins(select_inputs(invoke_type_group, selection),
+                                                     select_inputs(latency_violin_summary, selection), 'invoke_input')
+
     plot = (p9.ggplot(invoke_type_group, p9.aes(fill="Runtime",
                                                 x="trigger_type", y="latency"))
             + p9.labs(title="", x="Trigger Type", y="Latency (milliseconds)")
             + p9.theme(axis_text_x=p9.element_text(angle=45,
                        hjust=1), legend_position="top")
-            + p9.geom_violin(position=p9.position_dodge(1), width=1)
+            + p9.geom_violin(p9.aes(violinwidth="violinwidth"), stat="identity", position=p9.position_dodge(1), width=1)
             + p9.scale_y_log10(labels=format_labels)
             + p9.scale_x_discrete(labels=format_label_name)
             + p9.scale_fill_brewer(type="seq",  palette="YlGnBu",
                                    direction=-1, labels=format_names)
-            + p9.stat_summary(fun_data="mean_cl_boot", show_legend=False,
-                              size=0.2, width=0.5, geom="crossbar", color='gray',
-                              position=p9.position_dodge(1))
+            + p9.geom_crossbar(p9.aes(ymin="latency_low", ymax="latency_high"), data=invoke_type_summary, show_legend=False,
+                               size=0.2, width=0.5, color='gray',
+                               position=p9.position_dodge(1))
             + p9.facet_wrap('invoke_input', nrow=rows, labeller=format_title))
 
     p9.save_as_pdf_pages(
         [plot], filename="./../results/latency/plots/violin/latency_violin_all_" +
         str(invoke_type) + ".pdf")
 
+profiling.end_stage()
+profiling.start_stage("cdf", rows_in=len(latency_ecdf.index))
 
 for runtime, runtime_group in latency_runtime_groups:
 
@@ -184,15 +258,17 @@ for runtime, runtime_group in latency_runtime_groups:
 
         for invoke_input, invoke_input_group in latency_invoke_input_groups:
 
-            plot = (p9.ggplot(invoke_input_group, p9.aes(x='latency', col='trigger_type', colour='trigger_type')) + p9.labs(title="", y="CDF", x="Duration Time (milliseconds)", color="Trigger Type")
-                    + p9.theme(legend_position="top", axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14)) + p9.stat_ecdf(geom="line", alpha=0.9, size=0.7) + p9.scale_x_log10(labels=format_labels) + p9.scale_color_brewer(type="qual",  palette="Set1", labels=format_label_name))
+            plot = (p9.ggplot(invoke_input_group, p9.aes(x='latency', y='ecdf', col='trigger_type', colour='trigger_type')) + p9.labs(title="", y="CDF", x="Duration Time (milliseconds)", color="Trigger Type")
+                    + p9.theme(legend_position="top", axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14)) + p9.geom_line(alpha=0.9, size=0.7) + p9.scale_x_log10(labels=format_labels) + p9.scale_color_brewer(type="qual",  palette="Set1", labels=format_label_name))
 
             p9.save_as_pdf_pages(
                 [plot], filename="./../results/latency/plots/cdf/latency_cdf_" + str(runtime) + "_" +
                 str(invoke_type) + "_" + str(invoke_input) + ".pdf")
 
+profiling.end_stage()
+profiling.start_stage("violin", rows_in=len(latency_violin.index))
 
-latency_invoke_type_groups = latency_results.groupby('invoke_type')
+latency_invoke_type_groups = latency_violin.groupby('invoke_type')
 
 for invoke_type, invoke_type_group in latency_invoke_type_groups:
 
@@ -200,12 +276,15 @@ for invoke_type, invoke_type_group in latency_invoke_type_groups:
 
     for invoke_input, invoke_input_group in latency_invoke_input_groups:
 
-        invoke_input_group.rename(columns={'runtime': 'Runtime'}, inplace=True)
+        invoke_input_group, invoke_input_summary = violins(invoke_input_group, select_inputs(
+            latency_violin_summary, [(invoke_type, invoke_input)]), 'invoke_input')
 
         plot = (p9.ggplot(invoke_input_group, p9.aes(fill="Runtime",
                                                      x="trigger_type", y="latency")) + p9.labs(title="", x="Trigger Type", y="Latency (milliseconds)")
-                + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1), axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14), legend_position="top") + p9.geom_violin(position=p9.position_dodge(1), width=1) + p9.scale_y_log10(labels=format_labels) + p9.scale_x_discrete(labels=format_label_name) + p9.scale_fill_brewer(type="seq",  palette="YlGnBu", direction=-1, labels=format_names) + p9.stat_summary(fun_data="mean_cl_normal", show_legend=False, geom="point", position=p9.position_dodge(1)))
+                + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1), axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14), legend_position="top") + p9.geom_violin(p9.aes(violinwidth="violinwidth"), stat="identity", position=p9.position_dodge(1), width=1) + p9.scale_y_log10(labels=format_labels) + p9.scale_x_discrete(labels=format_label_name) + p9.scale_fill_brewer(type="seq",  palette="YlGnBu", direction=-1, labels=format_names) + p9.geom_point(data=invoke_input_summary, show_legend=False, position=p9.position_dodge(1)))
 
         p9.save_as_pdf_pages(
             [plot], filename="./../results/latency/plots/violin/latency_violin_" +
             str(invoke_type) + "_" + str(invoke_input) + ".pdf")
+
+profiling.end_stage()
@@ -2,6 +2,20 @@ import pandas as pd
 import numpy as np
 import plotnine as p9
 import os.path as os
+import argparse
+import profiling
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-input", "--input", default="./../results/reliability/results.csv",
+                    help="Reliability results written by analyze_reliability.py")
+parser.add_argument("-output", "--output", default="./../results/reliability/plots/",
+                    help="Directory to write the plots to")
+profiling.add_profile_arguments(parser)
+
+args = parser.parse_args()
+
+profiling.configure(args, "plot_reliability")
 
 
 def format_label_name(breaks):
@@ -50,14 +64,31 @@ def format_runtime(breaks):
         return "Node.js"
 
 
-reliability_results = pd.read_csv(
-    './../results/reliability/results.csv', delimiter=",")
+profiling.start_stage("load")
+
+reliability_results = pd.read_csv(args.input, delimiter=",")
+
+# analyze_reliability.py --skip_legacy_order leaves out_of_order empty, the
+# Kendall tau distance (share of inverted pairs) is plotted instead
+order_column = "out_of_order"
+if(reliability_results["out_of_order"].isna().all()):
+    if("kendall_tau_distance" in reliability_results.columns):
+        print("out_of_order was not computed (--skip_legacy_order), plotting kendall_tau_distance instead")
+        order_column = "kendall_tau_distance"
+    else:
+        print("out_of_order was not computed (--skip_legacy_order), skipping the out-of-order plots")
+        order_column = None
+
+profiling.end_stage(rows_out=len(reliability_results.index))
+profiling.start_stage("out_of_order_concat", rows_in=len(
+    reliability_results.index))
 
 reliability_results_concat = reliability_results[reliability_results['invoke_type'] == 'constant']
 
-reliability_results_concat['out_of_order'] = (reliability_results_concat['out_of_order'] /
-                                              (reliability_results_concat['original_executes']
-                                               ))
+if(order_column == "out_of_order"):
+    reliability_results_concat['out_of_order'] = (reliability_results_concat['out_of_order'] /
+                                                  (reliability_results_concat['original_executes']
+                                                   ))
 
 reliability_results_concat = reliability_results_concat.astype(
     {"invoke_input": 'category'}, errors='raise')
@@ -70,7 +101,7 @@ def format_labels(breaks):
     return [str(l) + " ms" for l in breaks]
 
 
-plot = (p9.ggplot(reliability_results_concat, p9.aes(fill="invoke_input", x="trigger_type", y="out_of_order"))
+plot = (p9.ggplot(reliability_results_concat, p9.aes(fill="invoke_input", x="trigger_type", y=order_column))
         + p9.ylim(0, 1) + p9.labs(title="", x="Trigger type",
                                   y="Probability", color="Trigger Type")
         + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1),
@@ -84,8 +115,12 @@ plot = (p9.ggplot(reliability_results_concat, p9.aes(fill="invoke_input", x="tri
                         )
         )
 
-p9.save_as_pdf_pages(
-    [plot], filename="./../results/reliability/plots/reliability_out_of_order_concat.pdf")
+if(order_column is not None):
+    p9.save_as_pdf_pages(
+        [plot], filename=args.output + "reliability_" + order_column + "_concat.pdf")
+
+profiling.end_stage()
+profiling.start_stage("per_runtime", rows_in=len(reliability_results.index))
 
 
 reliability_runtime_groups = reliability_results.groupby('runtime')
@@ -121,9 +156,10 @@ for runtime, runtime_group in reliability_runtime_groups:
             invoke_input_group['duplicates_executes'] = invoke_input_group['duplicates_executes'] / \
                 invoke_input_group['original_executes']
 
-            invoke_input_group['out_of_order'] = invoke_input_group['out_of_order'] / \
-                (invoke_input_group['original_executes'] -
-                 invoke_input_group['duplicates_executes'] - invoke_input_group['missing_executes'])
+            if(order_column == "out_of_order"):
+                invoke_input_group['out_of_order'] = invoke_input_group['out_of_order'] / \
+                    (invoke_input_group['original_executes'] -
+                     invoke_input_group['duplicates_executes'] - invoke_input_group['missing_executes'])
 
             current_row = pd.concat([current_row, invoke_input_group],
                                     ignore_index=True, axis=0)
@@ -136,7 +172,7 @@ for runtime, runtime_group in reliability_runtime_groups:
                 + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1), axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14), legend_position="top") + p9.geom_col(position="dodge") + p9.scale_x_discrete(labels=format_label_name) + p9.labs(fill=legend_title) + p9.scale_fill_brewer(type="seq",  palette="YlGnBu", direction=-1, labels=format_labels))
 
         p9.save_as_pdf_pages(
-            [plot], filename="./../results/reliability/plots/reliability_missing_executes_" + str(runtime) + "_" +
+            [plot], filename=args.output + "reliability_missing_executes_" + str(runtime) + "_" +
             str(invoke_type) + ".pdf")
 
         plot = (p9.ggplot(current_row, p9.aes(fill="invoke_input",
@@ -144,12 +180,17 @@ for runtime, runtime_group in reliability_runtime_groups:
                 + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1), axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14), legend_position="top") + p9.geom_col(position="dodge") + p9.scale_x_discrete(labels=format_label_name) + p9.labs(fill=legend_title) + p9.scale_fill_brewer(type="seq",  palette="YlGnBu", direction=-1, labels=format_labels))
 
         p9.save_as_pdf_pages(
-            [plot], filename="./../results/reliability/plots/reliability_duplicates_executes_" + str(runtime) + "_" +
+            [plot], filename=args.output + "reliability_duplicates_executes_" + str(runtime) + "_" +
             str(invoke_type) + ".pdf")
 
-        plot = (p9.ggplot(current_row, p9.aes(fill="invoke_input", x="trigger_type", y="out_of_order")) + p9.ylim(0, 1) + p9.labs(title="", x="Trigger type", y="Probability", color="Trigger Type")
+        if(order_column is None):
+            continue
+
+        plot = (p9.ggplot(current_row, p9.aes(fill="invoke_input", x="trigger_type", y=order_column)) + p9.ylim(0, 1) + p9.labs(title="", x="Trigger type", y="Probability", color="Trigger Type")
                 + p9.theme(axis_text_x=p9.element_text(angle=45, hjust=1), axis_title_y=p9.element_text(size=15), axis_title_x=p9.element_text(size=15), axis_text=p9.element_text(size=14), legend_position="top") + p9.geom_col(position=p9.position_dodge(0.8), width=0.8) + p9.scale_x_discrete(labels=format_label_name) + p9.labs(fill=legend_title) + p9.scale_fill_brewer(type="seq",  palette="YlGnBu", direction=-1, labels=format_labels))
 
         p9.save_as_pdf_pages(
-            [plot], filename="./../results/reliability/plots/reliability_out_of_order_" + str(runtime) + "_" +
+            [plot], filename=args.output + "reliability_" + order_column + "_" + str(runtime) + "_" +
             str(invoke_type) + ".pdf")
+
+profiling.end_stage()
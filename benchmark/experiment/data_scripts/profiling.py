@@ -0,0 +1,183 @@
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_DIR = './../results/profile/'
+
+SAMPLING_INTERVAL = 0.005
+
+# Profiling is off unless a script is started with --profile
+_enabled = False
+_script = None
+_report_path = None
+_profile_stage = None
+_profiler = None
+_stack = []
+_records = []
+# Profiles of --profile_stage per stage path, accumulated over every run of the stage
+_stage_profiles = {}
+
+
+def add_profile_arguments(parser):
+    parser.add_argument("-profile", "--profile", nargs="?", const="", default=None,
+                        help="Record wall time, CPU time, rows and peak memory per stage and write a JSON report, to the given path or " + PROFILE_DIR)
+    parser.add_argument("-profile_stage", "--profile_stage",
+                        help="Also capture a cProfile or sampling profile of this stage")
+    parser.add_argument("-profiler", "--profiler", choices=["sampling", "cprofile"], default="sampling",
+                        help="Profiler used for --profile_stage")
+
+
+def configure(args, script):
+    global _enabled, _script, _report_path, _profile_stage, _profiler
+    if(args.profile is None):
+        return
+    _enabled = True
+    _script = script
+    _report_path = args.profile if args.profile != "" else os.path.join(
+        PROFILE_DIR, script + ".json")
+    _profile_stage = args.profile_stage
+    _profiler = args.profiler
+    tracemalloc.start()
+    atexit.register(write_report)
+
+
+def current_rss_bytes():
+    # Resident set size right now, the second field of /proc/self/statm in
+    # pages. Only available on Linux, ru_maxrss is the peak of the whole
+    # process and says nothing about a single stage.
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def start_stage(name, rows_in=None):
+    if(not _enabled):
+        return
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    if(len(_stack) > 0):
+        _stack[-1]["_traced_peak"] = max(
+            _stack[-1]["_traced_peak"], traced_peak)
+    tracemalloc.reset_peak()
+
+    record = {"stage": "/".join([parent["name"] for parent in _stack] + [name]),
+              "name": name,
+              "rows_in": rows_in,
+              "rows_out": None,
+              "_wall": time.perf_counter(),
+              "_cpu": time.process_time(),
+              "_rss": current_rss_bytes(),
+              "_traced_peak": 0}
+    _stack.append(record)
+
+    if(name == _profile_stage):
+        start_stage_profile(record["stage"])
+
+
+def end_stage(rows_out=None):
+    if(not _enabled):
+        return
+    record = _stack.pop()
+    if(record["name"] == _profile_stage):
+        stop_stage_profile(record["stage"])
+
+    traced_peak = max(record.pop("_traced_peak"),
+                      tracemalloc.get_traced_memory()[1])
+    if(len(_stack) > 0):
+        _stack[-1]["_traced_peak"] = max(
+            _stack[-1]["_traced_peak"], traced_peak)
+
+    record["wall_time"] = time.perf_counter() - record.pop("_wall")
+    record["cpu_time"] = time.process_time() - record.pop("_cpu")
+    record["rows_out"] = rows_out
+    record["peak_traced_bytes"] = traced_peak
+    rss = current_rss_bytes()
+    start_rss = record.pop("_rss")
+    record["rss_delta_bytes"] = rss - start_rss if rss is not None and start_rss is not None else None
+    _records.append(record)
+
+
+def sample_stacks(thread_id, samples, stop):
+    while not stop.is_set():
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" +
+                         str(code.co_firstlineno) + ")")
+            frame = frame.f_back
+        if(len(stack) > 0):
+            folded = ";".join(reversed(stack))
+            samples[folded] = samples.get(folded, 0) + 1
+        time.sleep(SAMPLING_INTERVAL)
+
+
+def start_stage_profile(stage_path):
+    if(_profiler == "cprofile"):
+        profile = _stage_profiles.setdefault(
+            stage_path, {"profile": cProfile.Profile()})
+        profile["profile"].enable()
+    else:
+        profile = _stage_profiles.setdefault(stage_path, {"samples": {}})
+        profile["stop"] = threading.Event()
+        profile["thread"] = threading.Thread(target=sample_stacks, args=(threading.get_ident(), profile["samples"], profile["stop"]),
+                                             daemon=True)
+        profile["thread"].start()
+
+
+def stop_stage_profile(stage_path):
+    profile = _stage_profiles[stage_path]
+    if("profile" in profile):
+        profile["profile"].disable()
+    else:
+        profile["stop"].set()
+        profile["thread"].join()
+
+
+def write_stage_profiles():
+    for stage_path, profile in _stage_profiles.items():
+        base_path = os.path.splitext(_report_path)[
+            0] + "." + stage_path.replace("/", ".")
+        if("profile" in profile):
+            profile["profile"].dump_stats(base_path + ".prof")
+        else:
+            with open(base_path + ".folded", "w") as file:
+                for stack, count in sorted(profile["samples"].items()):
+                    file.write(stack + " " + str(count) + "\n")
+
+
+def write_report():
+    if(not _enabled):
+        return
+    # Close stages left open, e.g. when the script exited early
+    while len(_stack) > 0:
+        end_stage()
+
+    os.makedirs(os.path.dirname(_report_path) or ".", exist_ok=True)
+    with open(_report_path, "w") as file:
+        json.dump({"script": _script, "argv": sys.argv[1:], "stages": _records},
+                  file, indent=2)
+    write_stage_profiles()
+
+    # Self time of every stage path over all its runs in microseconds, as
+    # collapsed stacks for flamegraph tools
+    wall_time = {}
+    child_time = {}
+    for record in _records:
+        wall_time[record["stage"]] = wall_time.get(
+            record["stage"], 0) + record["wall_time"]
+        parent = record["stage"].rsplit("/", 1)[0] if "/" in record["stage"] else None
+        if(parent is not None):
+            child_time[parent] = child_time.get(
+                parent, 0) + record["wall_time"]
+    with open(os.path.splitext(_report_path)[0] + ".folded", "w") as file:
+        for stage_path, stage_time in wall_time.items():
+            self_time = max(stage_time - child_time.get(stage_path, 0), 0)
+            file.write(_script + ";" + stage_path.replace("/", ";") + " " +
+                       str(int(self_time * 1000000)) + "\n")
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# Displacement threshold used for the reorder density histogram (RFC 5236).
+# Displacements beyond the threshold are accumulated in the outermost bins.
+REORDER_DENSITY_THRESHOLD = 10
+
+
+def legacy_out_of_order(invoke_ids, receive_ids):
+    # Greedy walk that moves every out of order event into its invoke position,
+    # kept for comparison with earlier results. Quadratic in the number of events.
+    receive_ids = list(receive_ids)
+    count = -1
+    out_of_order = 0
+
+    for invoke_id in invoke_ids:
+        count = count + 1
+        if count < len(receive_ids):
+            if invoke_id != receive_ids[count]:
+                out_of_order = out_of_order + 1
+                if invoke_id in receive_ids:
+                    receive_ids.remove(invoke_id)
+                    receive_ids.insert(count, invoke_id)
+
+    return out_of_order
+
+
+def receive_ranks(invoke_ids, receive_ids):
+    # Map every received id to its position in the invoke sequence. Ids that
+    # were never invoked (or are missing from either side) are dropped.
+    invoke_index = pd.Index(invoke_ids)
+    if(not invoke_index.is_unique):
+        invoke_index = invoke_index.drop_duplicates()
+    ranks = invoke_index.get_indexer(pd.Index(receive_ids))
+    ranks = ranks[ranks >= 0]
+
+    # Compact the ranks to 0..n-1 so that lost events do not show up as
+    # displacement of everything invoked after them
+    order = np.argsort(ranks, kind='stable')
+    compact = np.empty(len(ranks), dtype=np.int64)
+    compact[order] = np.arange(len(ranks), dtype=np.int64)
+    return compact
+
+
+def count_inversions(ranks):
+    # Bottom-up merge sort where every merge level is done for all block pairs
+    # at once. Keys are offset by pair index so a single sort merges all pairs
+    # and a single searchsorted counts the inversions across each pair.
+    values = np.asarray(ranks, dtype=np.int64).copy()
+    n = len(values)
+    if(n < 2):
+        return 0
+
+    span = int(values.max()) + 1
+    positions = np.arange(n, dtype=np.int64)
+    inversions = 0
+    width = 1
+    while width < n:
+        pair = positions // (2 * width)
+        keys = pair * span + values
+        is_left = (positions // width) % 2 == 0
+
+        left_keys = keys[is_left]
+        right_keys = keys[~is_left]
+        right_pair = pair[~is_left]
+
+        # Left elements greater than a right element within the same pair
+        pair_end = np.searchsorted(left_keys, (right_pair + 1) * span, side='left')
+        not_greater = np.searchsorted(left_keys, right_keys, side='right')
+        inversions += int((pair_end - not_greater).sum())
+
+        values = np.sort(keys, kind='stable') - pair * span
+        width = width * 2
+
+    return inversions
+
+
+def reorder_density(displacements, threshold=REORDER_DENSITY_THRESHOLD):
+    clipped = np.clip(displacements, -threshold, threshold)
+    return np.bincount(clipped + threshold, minlength=2 * threshold + 1)
+
+
+def reordering_stats(invoke_ids, receive_ids, threshold=REORDER_DENSITY_THRESHOLD):
+    ranks = receive_ranks(invoke_ids, receive_ids)
+    n = len(ranks)
+
+    # Positive displacement means the event arrived later than its invoke
+    # position, negative that it overtook earlier invocations
+    displacements = np.arange(n, dtype=np.int64) - ranks
+
+    return {"compared": n,
+            "inversions": count_inversions(ranks),
+            "pairs": n * (n - 1) // 2,
+            "displacement_sum": int(np.abs(displacements).sum()),
+            "max_displacement": int(np.abs(displacements).max()) if n > 0 else 0,
+            "density": reorder_density(displacements, threshold)}
+
+
+def merge_reordering_stats(old, new):
+    return {"compared": old["compared"] + new["compared"],
+            "inversions": old["inversions"] + new["inversions"],
+            "pairs": old["pairs"] + new["pairs"],
+            "displacement_sum": old["displacement_sum"] + new["displacement_sum"],
+            "max_displacement": max(old["max_displacement"], new["max_displacement"]),
+            "density": old["density"] + new["density"]}
+
+
+def reordering_columns(stats):
+    compared = stats["compared"]
+    return {"inversions": stats["inversions"],
+            "kendall_tau_distance": stats["inversions"] / stats["pairs"] if stats["pairs"] > 0 else 0.0,
+            "max_displacement": stats["max_displacement"],
+            "mean_displacement": stats["displacement_sum"] / compared if compared > 0 else 0.0}
+
+
+def reorder_density_rows(key, stats, threshold=REORDER_DENSITY_THRESHOLD):
+    runtime, trigger_type, invoke_type, invoke_input = key
+    total = stats["density"].sum()
+    rows = []
+    for displacement, count in zip(range(-threshold, threshold + 1), stats["density"]):
+        rows.append({"runtime": runtime, "trigger_type": trigger_type, "invoke_type": invoke_type, "invoke_input": invoke_input,
+                     "displacement": displacement, "count": int(count), "density": count / total if total > 0 else 0.0})
+    return rows
@@ -0,0 +1,204 @@
+import argparse
+import sqlite3
+import os
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+CATALOG_PATH = './../catalog/runs.db'
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Receivers keep executing after the workload finished, telemetry of a run is
+# fetched until this long after its end
+DELIVERY_TAIL = timedelta(minutes=5)
+
+RUN_COLUMNS = ['run_id', 'trigger', 'runtime', 'location',
+               'invoke_mode', 'invoke_input', 'start_time', 'end_time']
+
+SETTING_COLUMNS = ['trigger', 'runtime', 'invoke_mode', 'invoke_input']
+
+# SQLite limits the number of bound parameters per statement
+MAX_PARAMETERS = 500
+
+
+def connect(path=CATALOG_PATH):
+    if(os.path.dirname(path) != ''):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute('''CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        trigger TEXT NOT NULL,
+        runtime TEXT NOT NULL,
+        location TEXT,
+        invoke_mode TEXT NOT NULL,
+        invoke_input INTEGER NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL)''')
+    connection.execute('''CREATE INDEX IF NOT EXISTS runs_setting
+        ON runs (trigger, runtime, invoke_mode, invoke_input)''')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS runs_start_time ON runs (start_time)')
+    return connection
+
+
+def record_run(connection, trigger, runtime, location, invoke_mode, invoke_input, start_time, end_time, run_id=None):
+    if(run_id is None):
+        run_id = uuid.uuid4().hex[0:12]
+    with connection:
+        connection.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (run_id, trigger.lower(), runtime, location, invoke_mode.lower(), int(invoke_input), start_time, end_time))
+    return run_id
+
+
+def select_runs(connection, run_ids=None, trigger=None, runtime=None, invoke_mode=None, invoke_input=None, since=None, until=None):
+    conditions = []
+    parameters = []
+    for column, value in [('trigger', trigger), ('runtime', runtime), ('invoke_mode', invoke_mode), ('invoke_input', invoke_input)]:
+        if(value is not None):
+            conditions.append(column + ' = ?')
+            parameters.append(value)
+    if(since is not None):
+        conditions.append('end_time >= ?')
+        parameters.append(since)
+    if(until is not None):
+        conditions.append('start_time <= ?')
+        parameters.append(until)
+
+    if(run_ids is None):
+        chunks = [None]
+    else:
+        run_ids = list(run_ids)
+        chunks = [run_ids[i:i + MAX_PARAMETERS]
+                  for i in range(0, len(run_ids), MAX_PARAMETERS)]
+
+    runs = []
+    for chunk in chunks:
+        chunk_conditions = list(conditions)
+        chunk_parameters = list(parameters)
+        if(chunk is not None):
+            chunk_conditions.append(
+                'run_id IN (' + ', '.join('?' * len(chunk)) + ')')
+            chunk_parameters.extend(chunk)
+        query = 'SELECT ' + ', '.join(RUN_COLUMNS) + ' FROM runs'
+        if(len(chunk_conditions) > 0):
+            query = query + ' WHERE ' + ' AND '.join(chunk_conditions)
+        runs.extend(connection.execute(query, chunk_parameters).fetchall())
+
+    runs = pd.DataFrame(runs, columns=RUN_COLUMNS)
+    if(run_ids is not None):
+        missing = sorted(set(run_ids) - set(runs['run_id']))
+        if(len(missing) > 0):
+            raise ValueError('Unknown run ids: ' + ', '.join(missing))
+    return runs.sort_values(by='start_time', ignore_index=True)
+
+
+def selected_runs(parser, connection, **selection):
+    # select_runs for the command line scripts. Exits on unknown run ids or an
+    # empty selection, which would otherwise fetch or analyze nothing.
+    try:
+        runs = select_runs(connection, **selection)
+    except ValueError as error:
+        parser.error(str(error))
+    if(len(runs.index) == 0):
+        parser.error('No cataloged runs match the selection')
+    return runs
+
+
+def fetch_windows(runs, delivery_tail=DELIVERY_TAIL):
+    # Union of the run windows, overlapping windows are merged so no telemetry is fetched twice
+    windows = []
+    for start_time, end_time in sorted(zip(runs['start_time'], runs['end_time'])):
+        start = datetime.strptime(start_time[0:19], TIME_FORMAT)
+        end = datetime.strptime(end_time[0:19], TIME_FORMAT) + \
+            timedelta(seconds=1) + delivery_tail
+        if(len(windows) > 0 and start <= windows[-1][1]):
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def setting_codes(frame, settings):
+    # Number of the row's setting in settings, -1 for settings not in it
+    code = np.zeros(len(frame.index), dtype=np.int64)
+    is_known = np.ones(len(frame.index), dtype=bool)
+    for column in SETTING_COLUMNS:
+        values = frame[column]
+        categories = settings[column]
+        if(column == 'invoke_input'):
+            # Raw data inputs may be strings, only their few distinct values are converted
+            value_codes, uniques = pd.factorize(values)
+            values = np.append(pd.to_numeric(pd.Series(uniques), errors='coerce').to_numpy(dtype=float),
+                               np.nan)[value_codes]
+            categories = categories.astype(float)
+        column_codes = pd.Categorical(values, categories=categories.unique()).codes
+        is_known = is_known & (column_codes >= 0)
+        code = code * (categories.nunique() + 1) + column_codes
+    return np.where(is_known, code, -1)
+
+
+def filter_entries(entries, runs, delivery_tail=DELIVERY_TAIL):
+    # Keep the raw data rows that belong to one of the runs. The run windows
+    # of every setting are merged, then every row is joined with the last
+    # window of its setting that started before it.
+    if(len(runs.index) == 0):
+        return entries.iloc[0:0]
+    windows = []
+    for setting, setting_runs in runs.groupby(SETTING_COLUMNS):
+        for start, end in fetch_windows(setting_runs, delivery_tail):
+            windows.append(setting + (start, end))
+    windows = pd.DataFrame(windows, columns=SETTING_COLUMNS + ['window_start', 'window_end'])
+    windows['setting'] = setting_codes(windows, runs)
+
+    rows = pd.DataFrame({'setting': setting_codes(entries, runs),
+                         'timestamp': pd.to_datetime(entries['timestamp']).to_numpy(),
+                         'row': np.arange(len(entries.index))})
+    rows = rows[(rows['setting'] >= 0) & rows['timestamp'].notna()].sort_values(by='timestamp', kind='stable')
+
+    joined = pd.merge_asof(rows, windows[['setting', 'window_start', 'window_end']].sort_values(by='window_start'),
+                           left_on='timestamp', right_on='window_start', by='setting')
+    kept = joined['row'][joined['timestamp'] <= joined['window_end']].to_numpy()
+    return entries.iloc[np.sort(kept)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-catalog", "--catalog",
+                        default=CATALOG_PATH, help="Path to the run catalog")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record a run")
+    record_parser.add_argument("-trigger", "--trigger", required=True)
+    record_parser.add_argument("-runtime", "--runtime", required=True)
+    record_parser.add_argument("-location", "--location")
+    record_parser.add_argument("-mode", "--mode", required=True)
+    record_parser.add_argument("-input", "--input", type=int, required=True)
+    record_parser.add_argument("-start", "--start", required=True,
+                               help="Start time in UTC, " + TIME_FORMAT)
+    record_parser.add_argument("-end", "--end", required=True,
+                               help="End time in UTC, " + TIME_FORMAT)
+    record_parser.add_argument("-run_id", "--run_id")
+
+    list_parser = subparsers.add_parser("list", help="List recorded runs")
+    list_parser.add_argument("-trigger", "--trigger")
+    list_parser.add_argument("-runtime", "--runtime")
+    list_parser.add_argument("-mode", "--mode")
+    list_parser.add_argument("-input", "--input", type=int)
+    list_parser.add_argument("-since", "--since")
+    list_parser.add_argument("-until", "--until")
+
+    args = parser.parse_args()
+
+    connection = connect(args.catalog)
+
+    if(args.command == "record"):
+        print(record_run(connection, args.trigger, args.runtime, args.location,
+                         args.mode, args.input, args.start, args.end, args.run_id))
+    elif(args.command == "list"):
+        runs = select_runs(connection, trigger=args.trigger, runtime=args.runtime, invoke_mode=args.mode,
+                           invoke_input=args.input, since=args.since, until=args.until)
+        print(runs.to_string(index=False))
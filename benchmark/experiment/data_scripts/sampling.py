@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# Application Insights keeps one row per itemCount sampled telemetry items, so
+# itemCount is the inverse of the probability that the row was kept. Totals are
+# estimated with Horvitz-Thompson weights. Invoke and execute totals are
+# estimated separately. A latency pair is kept or dropped as one operation and
+# is weighted by the operation's itemCount, not by the product of both sides.
+
+Z_95 = 1.96
+
+
+def item_counts(entries):
+    if('item_count' not in entries.columns):
+        return pd.Series(1, index=entries.index, dtype=np.int64)
+    return entries['item_count'].fillna(1).astype(np.int64).clip(lower=1)
+
+
+def with_item_count(entries):
+    entries = entries.copy()
+    entries['item_count'] = item_counts(entries)
+    return entries
+
+
+def estimated_total(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights.sum(), (weights * (weights - 1)).sum()
+
+
+def sampling_stats(invoke_weights, receive_weights, observed_missing):
+    invokes, invokes_var = estimated_total(invoke_weights)
+    executes, executes_var = estimated_total(receive_weights)
+
+    return {"invokes": invokes,
+            "invokes_var": invokes_var,
+            "executes": executes,
+            "executes_var": executes_var,
+            "observed_missing": observed_missing,
+            "sampled": bool(np.any(np.asarray(invoke_weights) > 1) or np.any(np.asarray(receive_weights) > 1))}
+
+
+def merge_sampling_stats(old, new):
+    merged = {key: old[key] + new[key]
+              for key in ["invokes", "invokes_var", "executes", "executes_var", "observed_missing"]}
+    merged["sampled"] = old["sampled"] or new["sampled"]
+    return merged
+
+
+def sampling_columns(stats):
+    invokes = stats["invokes"]
+    missing = invokes - stats["executes"]
+    margin = Z_95 * np.sqrt(stats["invokes_var"] + stats["executes_var"])
+    missing_low = min(max(missing - margin, 0.0), invokes)
+
+    return {"estimated_invokes": invokes,
+            "estimated_executes": stats["executes"],
+            "estimated_missing_executes": min(max(missing, 0.0), invokes),
+            "missing_executes_low": missing_low,
+            "missing_executes_high": min(max(missing + margin, 0.0), invokes),
+            # Rows were lost in the raw data, but the estimate is consistent
+            # with no lost events once sampling is accounted for
+            "sampling_explained": bool(stats["sampled"] and stats["observed_missing"] > 0 and missing_low == 0.0)}
+
+
+def weighted_latency_summary(latency, weights):
+    latency = np.asarray(latency, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    total = weights.sum()
+    mean = (weights * latency).sum() / total
+    variance = (weights * (latency - mean) ** 2).sum() / total
+    # Kish effective sample size of the weighted samples
+    effective = total ** 2 / (weights ** 2).sum()
+    margin = Z_95 * np.sqrt(variance / effective)
+
+    return {"samples": len(latency),
+            "estimated_count": total,
+            "effective_samples": effective,
+            "mean_latency": mean,
+            "mean_latency_low": mean - margin,
+            "mean_latency_high": mean + margin,
+            "sampled": bool(np.any(weights > 1))}
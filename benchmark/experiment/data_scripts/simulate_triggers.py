@@ -0,0 +1,349 @@
+import argparse
+import heapq
+import json
+import math
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import profiling
+
+# Workload shapes of workload/k6.js and run_benchmark.sh
+TOTAL_TARGET_SAMPLES = 3000
+BURST_SIZES = [1, 10, 50, 100, 300]
+INVOKE_DELAYS = [1, 10, 25, 50, 100, 150, 250]
+INTER_BURST_PAUSE_MS = 10000
+SINGLE_BURST_PAUSE_MS = 3000
+SINGLE_BURST_SAMPLES_SHARE = 50 / 3000
+CONSTANT_INVOCATIONS = 500
+
+# Pause between two simulated settings after the last event of the previous one was executed
+SETTLE_GAP_MS = 10000
+
+# Telemetry rows are formatted and written this many events at a time to bound memory use
+CHUNK_EVENTS = 1000000
+
+# The VUs of a burst do not start at exactly the same time
+BURST_SPREAD_MS = 50
+
+TRIGGERS = ["http", "storage", "queue",
+            "database", "eventhub", "eventgrid", "servicebustopic"]
+
+# Time from the k6 request until the invoker endpoint sent the event (CompletionTrack)
+INVOKER_DEFAULTS = {"invoker_ms": 20, "invoker_sigma": 0.3}
+
+EXECUTION_DEFAULTS = {"service_ms": 5, "service_sigma": 0.3,
+                      "concurrency": 16, "initial_instances": 1, "max_instances": 200,
+                      "cold_start_ms": 2000, "scale_interval_ms": 1000,
+                      "duplicate_rate": 0.0, "redelivery_ms": 30000, "loss_rate": 0.0}
+
+# Rough delivery characteristics of each trigger, override them with --models
+DELIVERY_MODELS = {
+    "http": {"delivery": "push", "latency_ms": 10, "latency_sigma": 0.4, "concurrency": 100},
+    "eventgrid": {"delivery": "push", "latency_ms": 300, "latency_sigma": 0.5, "concurrency": 100,
+                  "duplicate_rate": 0.0005},
+    "servicebustopic": {"delivery": "push", "latency_ms": 40, "latency_sigma": 0.5, "concurrency": 16,
+                        "duplicate_rate": 0.0005},
+    "storage": {"delivery": "poll", "min_interval_ms": 10000, "max_interval_ms": 10000, "backoff": 1, "jitter": 0.5,
+                "batch_size": 1000000, "latency_ms": 200, "latency_sigma": 0.5, "duplicate_rate": 0.001},
+    "queue": {"delivery": "poll", "min_interval_ms": 100, "max_interval_ms": 60000, "backoff": 2, "jitter": 0.2,
+              "batch_size": 16, "latency_ms": 20, "latency_sigma": 0.4, "duplicate_rate": 0.001},
+    "database": {"delivery": "poll", "min_interval_ms": 50, "max_interval_ms": 5000, "backoff": 100, "jitter": 0.2,
+                 "batch_size": 100, "latency_ms": 30, "latency_sigma": 0.4},
+    "eventhub": {"delivery": "batch", "batch_size": 100, "flush_ms": 1000,
+                 "latency_ms": 20, "latency_sigma": 0.4, "duplicate_rate": 0.0005}
+}
+
+
+def model_parameters(trigger, overrides=None):
+    parameters = dict(INVOKER_DEFAULTS)
+    parameters.update(EXECUTION_DEFAULTS)
+    parameters.update(DELIVERY_MODELS[trigger])
+    if(overrides is not None and trigger in overrides):
+        parameters.update(overrides[trigger])
+    return parameters
+
+
+def lognormal(median, sigma, size, rng):
+    return rng.lognormal(math.log(median), sigma, size)
+
+
+def burst_workload(burst_size, rng, samples=TOTAL_TARGET_SAMPLES):
+    if(burst_size == 1):
+        target = samples * SINGLE_BURST_SAMPLES_SHARE
+        pause = SINGLE_BURST_PAUSE_MS
+    else:
+        target = samples / 4
+        pause = INTER_BURST_PAUSE_MS
+    num_bursts = int(math.ceil(target / burst_size))
+    send_ms = np.repeat(np.arange(num_bursts, dtype=float) * pause, burst_size) + \
+        rng.uniform(0, BURST_SPREAD_MS, num_bursts * burst_size)
+    return send_ms, np.arange(1, len(send_ms) + 1)
+
+
+def constant_workload(invoke_delay, rng, invocations=CONSTANT_INVOCATIONS):
+    send_ms = np.arange(invocations, dtype=float) * invoke_delay
+    return send_ms, np.arange(invocations)
+
+
+def push_delivery(arrival_ms, parameters, rng):
+    return arrival_ms + lognormal(parameters["latency_ms"], parameters["latency_sigma"], len(arrival_ms), rng)
+
+
+def poll_delivery(arrival_ms, parameters, rng):
+    # A poller takes up to batch_size messages per poll. It polls again after
+    # min_interval_ms while messages are found and backs off towards
+    # max_interval_ms while the source is empty. Every wait is drawn from
+    # interval * (1 +- jitter), a fixed period would stay in phase with the
+    # workload pauses. arrival_ms must be sorted.
+    n = len(arrival_ms)
+    delivered_ms = np.empty(n)
+    jitter = parameters.get("jitter", 0)
+    interval = parameters["max_interval_ms"]
+    poll_ms = arrival_ms[0] - rng.uniform(0, interval) if n > 0 else 0.0
+    i = 0
+    while i < n:
+        available = int(np.searchsorted(arrival_ms, poll_ms, side='right'))
+        if(available > i):
+            taken = min(available, i + parameters["batch_size"])
+            delivered_ms[i:taken] = poll_ms
+            i = taken
+            interval = parameters["min_interval_ms"]
+        elif(interval >= parameters["max_interval_ms"]):
+            # Idle at the longest interval, skip the polls that cannot reach the next message yet
+            polls = math.ceil((arrival_ms[i] - poll_ms) / (interval * (1 + jitter)))
+            poll_ms = poll_ms + (interval * rng.uniform(1 - jitter, 1 + jitter, polls - 1)).sum()
+        else:
+            interval = min(interval * parameters["backoff"],
+                           parameters["max_interval_ms"])
+        poll_ms = poll_ms + interval * rng.uniform(1 - jitter, 1 + jitter)
+    return delivered_ms + lognormal(parameters["latency_ms"], parameters["latency_sigma"], n, rng)
+
+
+def batch_delivery(arrival_ms, parameters, rng):
+    # Events are flushed when batch_size events are buffered or at the end of
+    # every flush period, whichever comes first. arrival_ms must be sorted.
+    n = len(arrival_ms)
+    phase = rng.uniform(0, parameters["flush_ms"])
+    period = np.floor((arrival_ms - phase) / parameters["flush_ms"])
+    period_end = phase + (period + 1) * parameters["flush_ms"]
+
+    first_in_period = np.searchsorted(period, period, side='left')
+    batch = (np.arange(n) - first_in_period) // parameters["batch_size"]
+    last_in_batch = np.minimum(first_in_period + (batch + 1) * parameters["batch_size"],
+                               np.searchsorted(period, period, side='right')) - 1
+    is_full = (last_in_batch - first_in_period + 1) % parameters["batch_size"] == 0
+
+    delivered_ms = np.where(is_full, arrival_ms[last_in_batch], period_end)
+    return delivered_ms + lognormal(parameters["latency_ms"], parameters["latency_sigma"], n, rng)
+
+
+DELIVERY_FUNCTIONS = {"push": push_delivery,
+                      "poll": poll_delivery,
+                      "batch": batch_delivery}
+
+
+def execute(delivered_ms, parameters, rng):
+    # Heap scheduled function instances. Every instance runs `concurrency`
+    # executions at a time; when all slots are busy a new instance is started
+    # (at most one per scale interval) and serves its first event after the
+    # cold start. delivered_ms must be sorted.
+    n = len(delivered_ms)
+    service_ms = lognormal(
+        parameters["service_ms"], parameters["service_sigma"], n, rng)
+    concurrency = parameters["concurrency"]
+    cold_start_ms = parameters["cold_start_ms"]
+    scale_interval_ms = parameters["scale_interval_ms"]
+    max_instances = parameters["max_instances"]
+
+    slots = [0.0] * (parameters["initial_instances"] * concurrency)
+    heapq.heapify(slots)
+    instances = parameters["initial_instances"]
+    last_scale_ms = -math.inf
+
+    started_ms = np.empty(n)
+    for i in range(n):
+        arrival = delivered_ms[i]
+        if(slots[0] <= arrival):
+            start = arrival
+            heapq.heappop(slots)
+        elif(instances < max_instances and arrival - last_scale_ms >= scale_interval_ms):
+            instances = instances + 1
+            last_scale_ms = arrival
+            start = arrival + cold_start_ms
+            for _ in range(concurrency - 1):
+                heapq.heappush(slots, start)
+            if(slots[0] < start):
+                start = heapq.heappushpop(slots, start)
+        else:
+            start = heapq.heappop(slots)
+        started_ms[i] = start
+        heapq.heappush(slots, start + service_ms[i])
+    return started_ms, service_ms
+
+
+def simulate(trigger, invoke_mode, invoke_input, parameters, rng, samples=TOTAL_TARGET_SAMPLES, invocations=CONSTANT_INVOCATIONS):
+    if(invoke_mode == "burst"):
+        send_ms, iteration_ids = burst_workload(invoke_input, rng, samples)
+    else:
+        send_ms, iteration_ids = constant_workload(
+            invoke_input, rng, invocations)
+
+    n = len(send_ms)
+    invoked_ms = send_ms + \
+        lognormal(parameters["invoker_ms"],
+                  parameters["invoker_sigma"], n, rng)
+
+    order = np.argsort(invoked_ms, kind='stable')
+    delivered_ms = np.empty(n)
+    delivered_ms[order] = DELIVERY_FUNCTIONS[parameters["delivery"]](
+        invoked_ms[order], parameters, rng)
+
+    # Lost events are never executed. At-least-once delivery, duplicates are
+    # executed again after the redelivery delay.
+    is_lost = rng.random(n) < parameters["loss_rate"]
+    is_duplicate = ~is_lost & (rng.random(n) < parameters["duplicate_rate"])
+
+    order = np.flatnonzero(~is_lost)
+    order = order[np.argsort(delivered_ms[order], kind='stable')]
+    received_ms = np.full(n, np.nan)
+    service_ms = np.zeros(n)
+    received_ms[order], service_ms[order] = execute(
+        delivered_ms[order], parameters, rng)
+
+    return {"send_ms": send_ms, "invoked_ms": invoked_ms, "iteration_ids": iteration_ids,
+            "received_ms": received_ms, "service_ms": service_ms,
+            "is_lost": is_lost, "is_duplicate": is_duplicate,
+            "redelivery_ms": parameters["redelivery_ms"]}
+
+
+def format_timestamps(start, offsets_ms):
+    timestamps = np.datetime64(start, 'ms') + \
+        np.round(offsets_ms).astype('timedelta64[ms]')
+    return pd.Series(np.datetime_as_string(timestamps, unit='ms')).str.replace('T', ' ', regex=False).values
+
+
+def telemetry_rows(simulation, trigger, runtime, invoke_mode, invoke_input, start, first_operation_id, events=None):
+    # Rows in the raw data schema written by fetch_traces.py for the events in the `events` slice
+    if(events is None):
+        events = slice(0, len(simulation["send_ms"]))
+    send_ms = simulation["send_ms"][events]
+    iteration_ids = simulation["iteration_ids"][events]
+    service_ms = np.round(simulation["service_ms"][events]).astype(int)
+    operation_ids = np.arange(len(send_ms)) + \
+        first_operation_id + events.start
+    received = ~simulation["is_lost"][events]
+    is_duplicate = simulation["is_duplicate"][events]
+    duplicate_ms = simulation["received_ms"][events][is_duplicate] + \
+        simulation["redelivery_ms"]
+
+    if(trigger != "http"):
+        invoker_name = "completiontrack" + trigger
+    else:
+        invoker_name = "get /api/httptrigger-" + runtime
+
+    parts = [
+        pd.DataFrame({"type": "REQUEST", "name": "functions.invokerendpoint",
+                      "timestamp_ms": send_ms, "operation_id": operation_ids,
+                      "duration": "<250ms", "iteration_id": iteration_ids}),
+        pd.DataFrame({"type": "DEPENDENCY", "name": invoker_name,
+                      "timestamp_ms": simulation["invoked_ms"][events], "operation_id": operation_ids,
+                      "duration": "0", "iteration_id": iteration_ids}),
+        pd.DataFrame({"type": "DEPENDENCY", "name": "custom operationid " + trigger,
+                      "timestamp_ms": simulation["received_ms"][events][received], "operation_id": operation_ids[received],
+                      "duration": service_ms[received].astype(str), "iteration_id": iteration_ids[received]}),
+        pd.DataFrame({"type": "DEPENDENCY", "name": "custom operationid " + trigger,
+                      "timestamp_ms": duplicate_ms, "operation_id": operation_ids[is_duplicate],
+                      "duration": service_ms[is_duplicate].astype(str), "iteration_id": iteration_ids[is_duplicate]})]
+
+    rows = pd.concat(parts, ignore_index=True).sort_values(
+        by='timestamp_ms', kind='stable')
+    rows["timestamp"] = format_timestamps(start, rows["timestamp_ms"].values)
+    rows["runtime"] = runtime
+    rows["trigger"] = trigger
+    rows["invoke_mode"] = invoke_mode
+    rows["invoke_input"] = invoke_input
+    rows["item_count"] = 1
+    return rows[['type', 'name', 'timestamp', 'operation_id', 'runtime', 'trigger', 'duration', 'iteration_id', 'invoke_mode', 'invoke_input', 'item_count']]
+
+
+def write_telemetry(path, simulation, trigger, runtime, invoke_mode, invoke_input, start, first_operation_id, write_header):
+    n = len(simulation["send_ms"])
+    for chunk_start in range(0, n, CHUNK_EVENTS):
+        rows = telemetry_rows(simulation, trigger, runtime, invoke_mode, invoke_input, start, first_operation_id,
+                              slice(chunk_start, min(chunk_start + CHUNK_EVENTS, n)))
+        rows.to_csv(path, mode='w' if write_header else 'a',
+                    header=write_header, index=False)
+        write_header = False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-trigger", "--trigger", nargs="+", default=TRIGGERS,
+                        help="Triggers to simulate")
+    parser.add_argument("-runtime", "--runtime", nargs="+", default=["node", "dotnet"],
+                        help="Runtimes to label the simulated telemetry with")
+    parser.add_argument("-burst", "--burst", nargs="*", type=int, default=BURST_SIZES,
+                        help="Burst sizes to simulate")
+    parser.add_argument("-delay", "--delay", nargs="*", type=int, default=INVOKE_DELAYS,
+                        help="Inter-arrival times in ms to simulate")
+    parser.add_argument("-samples", "--samples", type=int, default=TOTAL_TARGET_SAMPLES,
+                        help="Target number of invocations over all burst sizes, as in k6.js")
+    parser.add_argument("-invocations", "--invocations", type=int, default=CONSTANT_INVOCATIONS,
+                        help="Number of invocations per inter-arrival time")
+    parser.add_argument("-models", "--models",
+                        help="JSON file with per-trigger overrides of the delivery model parameters")
+    parser.add_argument("-seed", "--seed", type=int, default=0)
+    parser.add_argument("-output", "--output", default="./../raw_data/simulated/",
+                        help="Directory to write <runtime>.csv files to")
+    profiling.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    profiling.configure(args, "simulate_triggers")
+
+    overrides = None
+    if(args.models is not None):
+        with open(args.models) as file:
+            overrides = json.load(file)
+
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.output, exist_ok=True)
+
+    settings = [("burst", burst_size) for burst_size in args.burst] + \
+        [("constant", invoke_delay) for invoke_delay in args.delay]
+
+    for runtime in args.runtime:
+        path = os.path.join(args.output, runtime + ".csv")
+        write_header = True
+        start_ms = 0.0
+        first_operation_id = 0
+        for trigger in args.trigger:
+            parameters = model_parameters(trigger, overrides)
+            print('Simulating ' + trigger + ' in ' + runtime)
+            profiling.start_stage(trigger)
+            for invoke_mode, invoke_input in settings:
+                profiling.start_stage("simulate")
+                simulation = simulate(trigger, invoke_mode, invoke_input, parameters, rng,
+                                      args.samples, args.invocations)
+                profiling.end_stage(rows_out=len(simulation["send_ms"]))
+                profiling.start_stage(
+                    "write", rows_in=len(simulation["send_ms"]))
+                start = datetime(2022, 1, 1) + \
+                    pd.Timedelta(milliseconds=start_ms)
+                write_telemetry(path, simulation, trigger, runtime, invoke_mode, invoke_input,
+                                start, first_operation_id, write_header)
+                write_header = False
+                profiling.end_stage()
+                first_operation_id = first_operation_id + \
+                    len(simulation["send_ms"])
+                # Settings run one after another, as in run_benchmark.sh.
+                # Duplicates are executed again up to redelivery_ms later.
+                end_ms = np.nanmax(simulation["received_ms"], initial=0)
+                if(simulation["is_duplicate"].any()):
+                    end_ms = end_ms + simulation["redelivery_ms"]
+                start_ms = start_ms + end_ms + SETTLE_GAP_MS
+            profiling.end_stage()
+
+    print("Finished")
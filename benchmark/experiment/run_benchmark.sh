@@ -13,7 +13,7 @@ deploy_http_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting Http benchmark"
-  run_k6
+  run_k6 http
   echo "Http benchmark finished"
 }
 
@@ -26,7 +26,7 @@ deploy_blob_storage_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting storage benchmark"
-  run_k6
+  run_k6 storage
   echo "Blob storage benchmark finished"
 }
 
@@ -39,7 +39,7 @@ deploy_queue_storage_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting queue benchmark"
-  run_k6
+  run_k6 queue
   echo "Queue storage benchmark finished"
 }
 
@@ -52,7 +52,7 @@ deploy_database_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting database benchmark"
-  run_k6
+  run_k6 database
   echo "Cosmos DB benchmark finished"
 }
 
@@ -65,7 +65,7 @@ deploy_service_bus_topic_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting Service bus benchmark"
-  run_k6
+  run_k6 servicebustopic
   echo "Service bus topic benchmark finished"
 }
 
@@ -78,7 +78,7 @@ deploy_event_hub_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting Event hub benchmark"
-  run_k6
+  run_k6 eventhub
   echo "Event hub benchmark finished"
 }
 
@@ -91,7 +91,7 @@ deploy_event_grid_trigger() {
   echo "Wait 10s before starting benchmark"
   sleep 10
   echo "Starting Event grid benchmark"
-  run_k6
+  run_k6 eventgrid
   echo "Event grid benchmark finished"
 }
 
@@ -106,25 +106,37 @@ deploy_all_triggers() {
 }
 
 
+# Record a run in the catalog so fetch_traces.py and the analyzers can select its exact window
+record_run() {
+  RUN_ID=$(cd data_scripts && python3 run_catalog.py record -trigger $1 -runtime $RUNTIME -location $LOCATION -mode $2 -input $3 -start "$4" -end "$5")
+  echo "Recorded run $RUN_ID"
+}
+
 run_k6() {
   var=$(grep BURST_SIZE ./../.env | cut -d '"' -f2)
   if [ "$var" = "all" ]; then
     for b in "${BURST_SIZES[@]}"; do
       echo "Running k6 with all sizes: $b" 
+      RUN_START=$(date -u +"%Y-%m-%d %H:%M:%S")
       k6 run -e BENCHMARK_URL=$(grep BENCHMARK_URL ./../.env | cut -d '"' -f2) -e BURST_SIZE=$b -e MODE='BURST' ./workload/k6.js --quiet
+      record_run $1 burst $b "$RUN_START" "$(date -u +"%Y-%m-%d %H:%M:%S")"
       echo "Waiting 10s" 
       sleep 10
     done
   else
     echo "Running k6 with burst size : ${var}"
+    RUN_START=$(date -u +"%Y-%m-%d %H:%M:%S")
     k6 run -e BENCHMARK_URL=$(grep BENCHMARK_URL ./../.env | cut -d '"' -f2) -e BURST_SIZE=${var} -e MODE='BURST' ./workload/k6.js --quiet
+    record_run $1 burst ${var} "$RUN_START" "$(date -u +"%Y-%m-%d %H:%M:%S")"
   fi
 
   for i in "${INVOKE_DELAYS[@]}"; do
       echo "Running k6 with invoke delay: $i" 
       echo "Waiting 10s" 
       sleep 10
+      RUN_START=$(date -u +"%Y-%m-%d %H:%M:%S")
       k6 run -e BENCHMARK_URL=$(grep BENCHMARK_URL ./../.env | cut -d '"' -f2) -e INVOKE_DELAY=$i -e MODE='CONSTANT' ./workload/k6.js --quiet
+      record_run $1 constant $i "$RUN_START" "$(date -u +"%Y-%m-%d %H:%M:%S")"
   done
 }
 
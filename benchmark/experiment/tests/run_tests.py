@@ -1,4 +1,12 @@
+import json
 import os
+import pstats
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 
 print("\nRunning tests")
@@ -45,6 +53,14 @@ if(is_test_ok):
 else:
     print("Test two reliability FAILED")
 
+is_test_ok = result["inversions"].values[0] == 4 and result["max_displacement"].values[0] == 2 and result[
+    "mean_displacement"].values[0] == 1 and abs(result["kendall_tau_distance"].values[0] - 4 / 15) < 1e-9
+
+if(is_test_ok):
+    print("Test two reordering OK")
+else:
+    print("Test two reordering FAILED")
+
 # Second test latency
 
 os.system(
@@ -86,4 +102,353 @@ if(is_test_ok):
 else:
     print("Test third latency FAILED")
 
+# Fourth test, receiver telemetry sampled by Application Insights
+os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test 4")
+
+result = pd.read_csv("results.csv")
+
+is_test_ok = result["original_invokes"].values[0] == 4 and result["original_executes"].values[0] == 2 and result["missing_executes"].values[0] == 2 and result[
+    "estimated_executes"].values[0] == 4 and result["estimated_missing_executes"].values[0] == 0 and result["missing_executes_low"].values[0] == 0 and result["sampling_explained"].values[0]
+
+if(is_test_ok):
+    print("Test fourth reliability OK")
+else:
+    print("Test fourth reliability FAILED")
+
+os.system(
+    "python3 ./../data_scripts/analyze_latency.py -test 4")
+
+result = pd.read_csv("results.csv")
+
+is_test_ok = result['latency'][0] == 20 and result['latency'][1] == 40 and result['weight'][0] == 2 and result['weight'][1] == 2
+
+if(is_test_ok):
+    print("Test fourth latency OK")
+else:
+    print("Test fourth latency FAILED")
+
+# Invoker and receiver of a sampled operation are kept together and count the operation once
+os.system(
+    "python3 ./../data_scripts/analyze_latency.py -test operation")
+
+result = pd.read_csv("results.csv")
+summary = pd.read_csv("summary.csv")
+
+is_test_ok = list(result['weight']) == [3, 2, 3, 2] and (summary['estimated_count'] == 5).all()
+
+if(is_test_ok):
+    print("Test fourth operation sampling latency OK")
+else:
+    print("Test fourth operation sampling latency FAILED")
+
+# Fifth test, select telemetry by cataloged run
+if(os.path.exists("catalog.db")):
+    os.remove("catalog.db")
+
+os.system(
+    "python3 ./../data_scripts/run_catalog.py -catalog ./catalog.db record -run_id matching -trigger database -runtime dotnet -mode constant -input 10 -start '2022-04-28 07:14:00' -end '2022-04-28 07:14:01' > /dev/null")
+os.system(
+    "python3 ./../data_scripts/run_catalog.py -catalog ./catalog.db record -run_id other -trigger database -runtime dotnet -mode burst -input 10 -start '2022-04-28 07:14:00' -end '2022-04-28 07:14:01' > /dev/null")
+
+os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test 3 -catalog ./catalog.db -runs matching")
+
+result = pd.read_csv("results.csv")
+
+is_test_ok = result["original_invokes"].values[0] == 8 and result["original_executes"].values[0] == 7
+
+os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test 3 -catalog ./catalog.db -runs other")
+
+result = pd.read_csv("results.csv")
+
+is_test_ok = is_test_ok and len(result.index) == 0
+
+# Unknown run ids and empty selections fail without overwriting any results
+status = os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test 3 -catalog ./catalog.db -runs matching missing 2> /dev/null")
+is_test_ok = is_test_ok and status != 0 and len(pd.read_csv("results.csv").index) == 0
+
+if(is_test_ok):
+    print("Test fifth run selection OK")
+else:
+    print("Test fifth run selection FAILED")
+
+os.remove("catalog.db")
+
+# Sixth test, analyze the telemetry of the trigger simulator
+os.system(
+    "python3 ./../data_scripts/simulate_triggers.py -trigger http queue -runtime node -burst 10 -delay -samples 400 -seed 1 -output ./ > /dev/null")
+
+os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test node")
+
+result = pd.read_csv("results.csv")
+result = result[result["runtime"] == "node"]
+
+is_test_ok = len(result.index) == 2 and (result["original_invokes"] == 100).all() and (
+    result["missing_executes"] == 0).all() and (result[result["trigger_type"] == "http"]["duplicates_executes"] == 0).all()
+
+if(is_test_ok):
+    print("Test sixth simulated reliability OK")
+else:
+    print("Test sixth simulated reliability FAILED")
+
+os.remove("node.csv")
+
+# Container polling is not in phase with the pauses between bursts, so latencies spread over the poll period
+os.system(
+    "python3 ./../data_scripts/simulate_triggers.py -trigger storage -runtime node -burst 10 -delay -samples 4000 -seed 1 -output ./ > /dev/null")
+os.system(
+    "python3 ./../data_scripts/analyze_latency.py -test node")
+
+result = pd.read_csv("results.csv")
+latency = result[result["runtime"] == "node"]["latency"]
+
+is_test_ok = len(latency.index) > 900 and abs(latency.median() - 10000) > 2000 and \
+    latency.quantile(0.75) - latency.quantile(0.25) > 2000
+
+if(is_test_ok):
+    print("Test sixth simulated polling latency OK")
+else:
+    print("Test sixth simulated polling latency FAILED")
+
+os.remove("node.csv")
+
+# Seventh test, the SQL backend computes the same results as the pandas analyzers
+is_test_ok = True
+for test in ["1", "2", "3", "4", "operation"]:
+    for script, command, sql_path in [("analyze_latency.py", "latency", "sql_latency.csv"), ("analyze_reliability.py", "reliability", "sql_reliability.csv")]:
+        os.system("python3 ./../data_scripts/" + script + " -test " + test)
+        os.system("python3 ./../data_scripts/analyze_sql.py -test " +
+                  test + " " + command)
+
+        result = pd.read_csv("results.csv")
+        sql_result = pd.read_csv(sql_path)
+        sql_result = sql_result[result.columns]
+
+        is_test_ok = is_test_ok and len(result.index) == len(sql_result.index) and (
+            result.sort_values(by=list(result.columns), ignore_index=True).fillna(-1).round(9) == sql_result.sort_values(by=list(result.columns), ignore_index=True).fillna(-1).round(9)).all().all()
+        os.remove(sql_path)
+
+if(is_test_ok):
+    print("Test seventh sql backend OK")
+else:
+    print("Test seventh sql backend FAILED")
+
+# Eighth test, run a campaign of two stacks concurrently against the local fake backend
+if(os.path.exists("catalog.db")):
+    os.remove("catalog.db")
+
+os.system(
+    "python3 ./../data_scripts/campaign.py -backend local -trigger http queue -runtime node -burst 10 -delay -budget 2 -time_scale 0.0005 -seed 1 -catalog ./catalog.db -timeline ./timeline.csv > /dev/null")
+
+result = pd.read_csv("timeline.csv")
+stacks = result.groupby("trigger").agg(start=("start", "min"), end=("end", "max"))
+
+connection = sqlite3.connect("catalog.db")
+recorded_runs = connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+connection.close()
+
+is_test_ok = len(result.index) == 8 and (result["status"] == "done").all() and recorded_runs == 2 and stacks["start"].max() < stacks["end"].min()
+
+# The quiet period only starts once the first executions reached the telemetry
+sys.path.append("./../data_scripts")
+from campaign import quiescence_probe
+
+
+class DelayedTelemetry:
+    def __init__(self):
+        self.time = 0
+        self.count = 0
+
+    def now(self):
+        return self.time
+
+    def telemetry_count(self, trigger, runtime, since):
+        return self.count
+
+
+telemetry = DelayedTelemetry()
+probe = quiescence_probe(telemetry, "queue", "node", 0, 10, quiet_period=60)
+is_quiescent = []
+for time, count in [(0, 0), (120, 0), (240, 0), (300, 5), (330, 5), (360, 5), (400, 10)]:
+    telemetry.time = time
+    telemetry.count = count
+    is_quiescent.append(probe())
+
+is_test_ok = is_test_ok and is_quiescent == [False, False, False, False, False, True, True]
+
+if(is_test_ok):
+    print("Test eighth campaign OK")
+else:
+    print("Test eighth campaign FAILED")
+
+os.remove("catalog.db")
+os.remove("timeline.csv")
+
+# Ninth test, downsampled ECDF stays within its error bound and violin outlines integrate to one
+from distributions import ECDF_MAX_ERROR, ecdf_table, density_table
+
+rng = np.random.default_rng(1)
+samples = pd.DataFrame({"runtime": "node", "trigger_type": np.repeat(["queue", "eventhub"], 20000), "invoke_type": "burst",
+                        "invoke_input": 10, "latency": np.round(rng.lognormal(5, 1, 40000))})
+
+ecdf = ecdf_table(samples)
+density = density_table(samples)
+
+is_test_ok = True
+for trigger_type, group in samples.groupby("trigger_type"):
+    values = np.sort(group["latency"].values)
+    unique_values = np.unique(values)
+    exact = np.searchsorted(values, unique_values, side="right") / len(values)
+    compact = ecdf[ecdf["trigger_type"] == trigger_type]
+    outline = density[density["trigger_type"] == trigger_type]
+    area = np.trapz(outline["density"], np.log10(outline["latency"]))
+    is_test_ok = is_test_ok and len(compact.index) <= 2 / ECDF_MAX_ERROR + 2 and np.abs(
+        np.interp(unique_values, compact["latency"], compact["ecdf"]) - exact).max() <= ECDF_MAX_ERROR and abs(area - 1) < 0.05
+
+if(is_test_ok):
+    print("Test ninth plot precomputation OK")
+else:
+    print("Test ninth plot precomputation FAILED")
+
+# Tenth test, modes of polled and batched latencies are found with their spacing and weight
+from modality import mode_table, modality_table
+
+polled = np.round(rng.choice([1, 2, 3], 30000, p=[0.5, 0.3, 0.2]) * 1000 + rng.lognormal(3, 0.5, 30000))
+pushed = np.round(rng.lognormal(2.3, 0.4, 30000))
+samples = pd.DataFrame({"runtime": "node", "trigger_type": np.repeat(["queue", "http"], 30000), "invoke_type": "burst",
+                        "invoke_input": 10, "latency": np.concatenate([polled, pushed]),
+                        "weight": np.concatenate([np.where(polled < 1500, 2, 1), np.ones(30000)])})
+
+modes = mode_table(samples)
+modality = modality_table(modes).set_index("trigger_type")
+queue_modes = modes[modes["trigger_type"] == "queue"]
+
+if(modality.loc["http", "modes"] == 1 and modality.loc["queue", "modes"] == 3 and
+        abs(modality.loc["queue", "mode_spacing"] - 1000) < 50 and
+        np.abs(queue_modes["weight"].values - np.array([1, 0.3, 0.2]) / 1.5).max() < 0.02 and
+        modality.loc["queue", "tuning"] != "" and modality.loc["http", "tuning"] == ""):
+    print("Test tenth latency modality OK")
+else:
+    print("Test tenth latency modality FAILED")
+
+# Eleventh test, profiler report, folded self times and a stage profile accumulated over every run of the stage
+os.system(
+    "python3 ./../data_scripts/simulate_triggers.py -trigger queue -runtime node -burst 10 100 -delay 50 -samples 400 -invocations 50 -seed 1 -output ./profile/ -profile ./profile/simulate.json -profile_stage simulate -profiler cprofile > /dev/null")
+
+with open("./profile/simulate.json") as file:
+    stages = pd.DataFrame(json.load(file)["stages"])
+with open("./profile/simulate.folded") as file:
+    folded = [line.rsplit(" ", 1)[0] for line in file.read().splitlines()]
+stage_stats = pstats.Stats("./profile/simulate.queue.simulate.prof").stats
+simulate_calls = [stats[1] for function, stats in stage_stats.items() if function[2] == "simulate"]
+
+parent = stages[stages["stage"] == "queue"].iloc[0]
+children = stages[stages["stage"].str.startswith("queue/")]
+
+is_test_ok = (children["stage"] == "queue/simulate").sum() == 3 and (children["rows_out"].dropna() > 0).all() and \
+    parent["peak_traced_bytes"] >= children["peak_traced_bytes"].max() and parent["wall_time"] >= children["wall_time"].sum() and \
+    sorted(folded) == ["simulate_triggers;queue", "simulate_triggers;queue;simulate", "simulate_triggers;queue;write"] and \
+    simulate_calls == [3] and "peak_rss_bytes" not in stages.columns and stages["rss_delta_bytes"].notna().all()
+
+if(is_test_ok):
+    print("Test eleventh profiling OK")
+else:
+    print("Test eleventh profiling FAILED")
+
+shutil.rmtree("./profile")
+
+# Twelfth test, Insights query cache keys, hour aligned slices, caching only closed windows and LRU eviction
+import insights_cache
+
+start = datetime(2022, 4, 28, 7, 14, 5)
+subset_slices = insights_cache.time_slices(start, datetime(2022, 4, 28, 9, 30))
+superset_slices = insights_cache.time_slices(datetime(2022, 4, 28, 6, 50), datetime(2022, 4, 28, 10, 5))
+
+is_test_ok = insights_cache.cache_key("app", "dependencies\n  | where  name == 'x'", start, start + timedelta(hours=1)) == \
+    insights_cache.cache_key("app", " dependencies | where name == 'x' ", start, start + timedelta(hours=1)) and \
+    insights_cache.cache_key("app", "dependencies", start, start + timedelta(hours=1)) != \
+    insights_cache.cache_key("app", "dependencies", start, start + timedelta(hours=2)) and \
+    subset_slices[0] == (start, datetime(2022, 4, 28, 8, 0)) and subset_slices[-1][1] == datetime(2022, 4, 28, 9, 30) and \
+    (datetime(2022, 4, 28, 8, 0), datetime(2022, 4, 28, 9, 0)) in superset_slices and \
+    all(slice_start.minute == 0 for slice_start, _ in subset_slices[1:])
+
+cache_dir = tempfile.mkdtemp()
+requested = []
+
+
+def fake_request_query(app_id, headers, query):
+    requested.append(query)
+    return {"tables": [{"name": "PrimaryResult", "columns": [], "rows": [["x" * 1000]]}]}
+
+
+insights_cache.request_query = fake_request_query
+now = datetime.utcnow()
+closed = (now - timedelta(hours=2), now - timedelta(hours=1))
+open_window = (now - timedelta(minutes=30), now - timedelta(minutes=5))
+for _ in range(2):
+    closed_result = insights_cache.query_window("app", {}, "dependencies", *closed, cache_dir=cache_dir)
+    open_result = insights_cache.query_window("app", {}, "dependencies", *open_window, cache_dir=cache_dir)
+
+is_test_ok = is_test_ok and insights_cache.is_closed(closed[1], now) and not insights_cache.is_closed(open_window[1], now) and \
+    closed_result[1] and not open_result[1] and len(requested) == 3
+
+# The least recently read entries are evicted first
+paths = [insights_cache.cache_path(insights_cache.cache_key("app", "query " + str(i), *closed), cache_dir) for i in range(3)]
+for i, path in enumerate(paths):
+    insights_cache.write_cache(path, {"rows": [i]})
+    os.utime(path, (1000 + i, 1000 + i))
+insights_cache.read_cache(paths[0])
+insights_cache.evict_cache(cache_dir, os.path.getsize(insights_cache.cache_path(insights_cache.cache_key("app", "dependencies", *closed), cache_dir)) +
+                           os.path.getsize(paths[0]) + os.path.getsize(paths[2]))
+
+is_test_ok = is_test_ok and os.path.exists(paths[0]) and not os.path.exists(paths[1]) and os.path.exists(paths[2])
+
+# A fetch of several windows writes all its slices and scans the cache for eviction once at the end
+evictions = []
+evict_cache = insights_cache.evict_cache
+
+
+def counting_evict_cache(*args):
+    evictions.append(args)
+    evict_cache(*args)
+
+
+insights_cache.evict_cache = counting_evict_cache
+windows = [(now - timedelta(hours=8), now - timedelta(hours=5)), (now - timedelta(hours=4), now - timedelta(hours=2))]
+merged = insights_cache.query_insights_windows("app", {}, "requests", windows, cache_dir=cache_dir, max_bytes=0)
+insights_cache.evict_cache = evict_cache
+
+is_test_ok = is_test_ok and len(merged["tables"][0]["rows"]) == len(insights_cache.time_slices(*windows[0])) + \
+    len(insights_cache.time_slices(*windows[1])) and evictions == [(cache_dir, 0)] and \
+    not any(files for _, _, files in os.walk(cache_dir))
+
+shutil.rmtree(cache_dir)
+
+if(is_test_ok):
+    print("Test twelfth insights cache OK")
+else:
+    print("Test twelfth insights cache FAILED")
+
+# Thirteenth test, reliability plots fall back to the Kendall tau distance without the legacy out_of_order count
+os.system(
+    "python3 ./../data_scripts/analyze_reliability.py -test 3 -skip_legacy_order")
+os.makedirs("./plots", exist_ok=True)
+output = os.popen(
+    "python3 ./../data_scripts/plot_reliability.py -input ./results.csv -output ./plots/ 2> /dev/null").read()
+plots = sorted(os.listdir("./plots"))
+
+is_test_ok = "plotting kendall_tau_distance instead" in output and "reliability_kendall_tau_distance_concat.pdf" in plots and \
+    "reliability_kendall_tau_distance_node_constant.pdf" in plots and not any("out_of_order" in plot for plot in plots)
+
+if(is_test_ok):
+    print("Test thirteenth reliability plots without legacy order OK")
+else:
+    print("Test thirteenth reliability plots without legacy order FAILED")
+
+shutil.rmtree("./plots")
+
 print("")